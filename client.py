@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+Client of run.py service, sends get-conf, tune or apply job and prints results
+in ndjson format as soon as equipment is processed
+
+usage:
+    client.py <socket> <arg>...
+
+arguments:
+    <socket>                  unix socket of run.py serve
+    <arg>                     arguments of run.py get-conf, tune or apply command,
+                              paths are resolved by the service, so absolute
+                              paths are preferable
+
+example:
+    client.py /tmp/dlink.sock -- get-conf 10.0.0.0/24 -w 10 -a /var/dlink/archive
+"""
+
+
+# модуль намеренно использует только стандартную библиотеку, чтобы
+# запуск клиента не требовал загрузки модулей, нужных для работы
+# с оборудованием
+
+
+import json
+import socket
+import sys
+
+
+def main(argv):
+    if len(argv) < 2 or argv[0] in ['-h', '--help']:
+        sys.stdout.write(__doc__.lstrip())
+        return 0
+
+    path, args = argv[0], argv[1:]
+    if args[0] == '--':
+        args = args[1:]
+
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(path)
+    except socket.error as exc:
+        sys.stderr.write('%s: %s\n' % (path, exc))
+        return 1
+
+    conn.sendall(json.dumps(args) + '\n')
+
+    # последняя строка ответа содержит код завершения задания
+    code = 1
+    for line in conn.makefile('r'):
+        result = json.loads(line)
+        if 'exit' in result:
+            if result.get('error'):
+                sys.stderr.write(result['error'] + '\n')
+            code = result['exit']
+            break
+        sys.stdout.write(line)
+        sys.stdout.flush()
+
+    conn.close()
+    return code
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Архив конфигурационных файлов оборудования.
+
+Структура папки архива:
+    blobs/<2 символа хэша>/<остаток хэша>.gz - сжатые конфигурационные файлы,
+        имя файла - sha1 его содержимого, поэтому одинаковые файлы
+        разного оборудования и разных дней хранятся один раз
+    refs/<ip> - ссылка на последний конфигурационный файл оборудования
+        в формате json (хэш, время сохранения, отпечаток конфигурации)
+    manifests/<время запуска>.manifest - соответствие ip адресов хэшам
+        конфигурационных файлов, полученных за один запуск
+"""
+
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+class Archive(object):
+    """
+    Класс для работы с архивом конфигурационных файлов.
+    """
+
+    def __init__(self, path):
+        """
+        Конструктор класса.
+
+        :param path: путь к папке архива
+        """
+
+        self.path = path
+        self.run_id = time.strftime('%Y%m%d-%H%M%S')
+        self._manifest = None
+        self._lock = threading.Lock()
+
+        for name in ['blobs', 'refs', 'manifests']:
+            dir_path = os.path.join(self.path, name)
+            if not os.path.isdir(dir_path):
+                try:
+                    os.makedirs(dir_path)
+                except OSError as exc:
+                    raise ArchiveException(exc)
+
+    def _blob_path(self, digest):
+        return os.path.join(self.path, 'blobs', digest[:2], digest[2:] + '.gz')
+
+    def _ref_path(self, ip):
+        return os.path.join(self.path, 'refs', ip)
+
+    @staticmethod
+    def _write(path, data, compress=False):
+        """
+        Метод атомарной записи файла через временный файл.
+
+        :param path: путь к файлу
+        :param data: строка
+        :param compress: сжимать ли содержимое файла
+        """
+
+        tmp_path = '%s.%s.tmp' % (path, threading.current_thread().ident)
+
+        if compress:
+            _f = gzip.open(tmp_path, 'wb')
+        else:
+            _f = open(tmp_path, 'wb')
+
+        try:
+            _f.write(data)
+        finally:
+            _f.close()
+
+        os.rename(tmp_path, path)
+
+    def get_ref(self, ip):
+        """
+        Метод получения ссылки на последний конфигурационный файл оборудования.
+
+        :param ip: ip адрес оборудования
+        :rtype: словарь с ключами hash, time, fingerprint или None
+        """
+
+        try:
+            with open(self._ref_path(ip), 'r') as _f:
+                return json.load(_f)
+        except (IOError, ValueError):
+            return None
+
+    def get(self, ip):
+        """
+        Метод получения последнего конфигурационного файла оборудования.
+
+        :param ip: ip адрес оборудования
+        :rtype: строка с конфигурационным файлом или None
+        """
+
+        ref = self.get_ref(ip)
+        if not ref:
+            return None
+
+        return self.get_blob(ref['hash'])
+
+    def get_blob(self, digest):
+        """
+        Метод получения конфигурационного файла по его хэшу.
+
+        :param digest: хэш конфигурационного файла
+        :rtype: строка с конфигурационным файлом
+        """
+
+        try:
+            _f = gzip.open(self._blob_path(digest), 'rb')
+            try:
+                return _f.read()
+            finally:
+                _f.close()
+        except IOError as exc:
+            raise ArchiveException(exc)
+
+    def put(self, ip, config, fingerprint=None):
+        """
+        Метод сохранения конфигурационного файла оборудования в архив.
+        Если конфигурационный файл с таким хэшем уже есть в архиве,
+        он повторно не записывается.
+
+        :param ip: ip адрес оборудования
+        :param config: строка с конфигурационным файлом
+        :param fingerprint: отпечаток конфигурации оборудования
+        :rtype: кортеж из хэша конфигурационного файла и признака того,
+                что конфигурационный файл оборудования изменился
+        """
+
+        digest = hashlib.sha1(config).hexdigest()
+        ref = self.get_ref(ip)
+        changed = not ref or ref['hash'] != digest
+
+        try:
+            blob_path = self._blob_path(digest)
+            if not os.path.exists(blob_path):
+                blob_dir = os.path.dirname(blob_path)
+                if not os.path.isdir(blob_dir):
+                    try:
+                        os.makedirs(blob_dir)
+                    except OSError:
+                        # папка создана параллельно
+                        if not os.path.isdir(blob_dir):
+                            raise
+                self._write(blob_path, config, compress=True)
+
+            if changed or ref.get('fingerprint') != fingerprint:
+                self._write(self._ref_path(ip), json.dumps({
+                    'hash': digest,
+                    'time': int(time.time()),
+                    'fingerprint': fingerprint
+                }))
+
+            self._add_to_manifest(ip, digest)
+
+        except EnvironmentError as exc:
+            raise ArchiveException(exc)
+
+        return digest, changed
+
+    def keep(self, ip):
+        """
+        Метод включения в манифест запуска последнего сохраненного
+        конфигурационного файла оборудования, если новый файл
+        не получался.
+
+        :param ip: ip адрес оборудования
+        """
+
+        ref = self.get_ref(ip)
+        if ref:
+            try:
+                self._add_to_manifest(ip, ref['hash'])
+            except EnvironmentError as exc:
+                raise ArchiveException(exc)
+
+    def _add_to_manifest(self, ip, digest):
+        """
+        Метод добавления записи в манифест запуска.
+
+        :param ip: ip адрес оборудования
+        :param digest: хэш конфигурационного файла
+        """
+
+        with self._lock:
+            if not self._manifest:
+                self._manifest = open(os.path.join(
+                    self.path, 'manifests', self.run_id + '.manifest'
+                ), 'a')
+            self._manifest.write('%s %s\n' % (ip, digest))
+            self._manifest.flush()
+
+    def close(self):
+        """
+        Метод закрытия манифеста запуска.
+        """
+
+        with self._lock:
+            if self._manifest:
+                self._manifest.close()
+                self._manifest = None
+
+
+class ArchiveException(Exception):
+    """
+    Базовое исключение.
+    """
+    pass
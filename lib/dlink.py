@@ -1,20 +1,128 @@
 # -*- coding: utf-8 -*-
 
 
+import collections
+import hashlib
+import json
 import os
 import time
 import re
 import socket
+import threading
 
-import paramiko
-from pysnmp.proto.rfc1902 import IpAddress, Integer, OctetString
-import pyparsing as pp
-
+import lazy
+import metrics
+import mib
 import service
 import snmp
 from logger import logger
 
 
+# ssh нужен только для метода загрузки ssh, pyparsing - только для разбора
+# конфигурационного файла, типы snmp - только для set запросов
+paramiko = lazy.LazyModule('paramiko')
+pp = lazy.LazyModule('pyparsing')
+rfc1902 = lazy.LazyModule('pysnmp.proto.rfc1902')
+
+
+# регулярное выражение для выделения типа оборудования из sysDescr
+eqp_type_re = re.compile(r'[A-z]+-\d+[A-z]*')
+
+# опции, состояние которых не определяется по snmp (нет соответствия
+# в стандартных mib), при источнике состояния snmp они не настраиваются
+snmp_unsupported = ['traffic_segmentation', 'dhcp_local_relay']
+
+# ветка oid'ов оборудования d-link (sysObjectID)
+dlink_oid_prefix = '1.3.6.1.4.1.171.'
+
+# свободные ssh соединения с TFTP серверами по ключу (сервер, пользователь),
+# соединение используется повторно для следующих передач файлов
+_ssh_idle = collections.defaultdict(list)
+_ssh_lock = threading.Lock()
+
+
+def discover(ip, community_read, timeout=1, retries=0):
+    """
+    Функция опроса адреса на предмет наличия оборудования d-link.
+    sysDescr и sysObjectID запрашиваются одним snmp запросом.
+
+    :param ip: ip адрес
+    :param community_read: имя community для чтения параметров по протоколу snmp
+    :param timeout: время ожидания ответа
+    :param retries: количество повторных запросов
+    :rtype: кортеж из типа оборудования и sysObjectID или None, если
+            оборудование не отвечает или не является оборудованием d-link
+    """
+
+    oid_sysdescr = '1.3.6.1.2.1.1.1.0'
+    oid_sysobjectid = '1.3.6.1.2.1.1.2.0'
+
+    eqp_snmp = snmp.Snmp(ip, community_read, '', timeout=timeout, retries=retries)
+
+    try:
+        (_o, sysdescr), (_o, sysobjectid) = eqp_snmp.get(
+            oid_sysdescr, oid_sysobjectid
+        )
+    except snmp.SnmpException as snmp_exc:
+        logger.debug(snmp_exc)
+        return None
+
+    sysobjectid = '.'.join(str(i) for i in tuple(sysobjectid))
+    match = eqp_type_re.search(str(sysdescr))
+
+    if not match or not sysobjectid.startswith(dlink_oid_prefix):
+        logger.debug(
+            '%s - оборудование не распознано - %s' % (ip, sysdescr)
+        )
+        return None
+
+    logger.info(
+        '%s - обнаружено оборудование - %s' % (ip, match.group())
+    )
+
+    return match.group(), sysobjectid
+
+
+def without_snmp_unsupported(ip, option_dict):
+    """
+    Функция удаления из словаря настроек опций, состояние которых
+    не определяется по snmp, иначе команды для них формировались бы
+    при каждой настройке либо расхождения скрывались бы.
+
+    :param ip: ip адрес оборудования, для сообщения
+    :param option_dict: словарь с настройками оборудования
+    :rtype: словарь с настройками оборудования
+    """
+
+    result = {}
+    skipped = set()
+
+    for section, options in service.plain(option_dict).iteritems():
+        result[section] = {}
+        for key, value in options.iteritems():
+            if key in snmp_unsupported:
+                skipped.add(key)
+                continue
+
+            # опция dhcp_local_relay задается для каждого vlan
+            if key == 'vlan' and isinstance(value, dict):
+                for name, vlan in value.iteritems():
+                    if isinstance(vlan, dict) and \
+                            'dhcp_local_relay' in vlan:
+                        skipped.add('dhcp_local_relay')
+                        del vlan['dhcp_local_relay']
+
+            result[section][key] = value
+
+    if skipped:
+        logger.warning(
+            '%s - опции %s не определяются по snmp и не настраиваются' %
+            (ip, ', '.join(sorted(skipped)))
+        )
+
+    return result
+
+
 class Dlink(object):
     """
     Класс для работы с оборудованием d-link.
@@ -30,6 +138,8 @@ class Dlink(object):
                  tftp_path='',
                  username='',
                  password='',
+                 fingerprint_oids=(),
+                 snmp_timeout=3,
                  **kwargs):
         """
         Конструктор класса.
@@ -43,21 +153,49 @@ class Dlink(object):
         :param tftp_path: путь к папке TFTP сервера
         :param username: имя пользователя для авторизации на сервер TFTP по протоколу ssh
         :param password: пароль пользователя для авторизации на сервер TFTP по протоколу ssh
+        :param fingerprint_oids: oid'ы признаков изменения конфигурации оборудования
+        :param snmp_timeout: время ожидания ответа на snmp запрос
         """
 
         self.ip = ip
-        self.tftp_server = tftp_server
-        self.config_load_method = config_load_method
-        self.tftp_path = tftp_path
-        self.username = username
-        self.password = password
-        self.snmp = snmp.Snmp(self.ip, community_read, community_write, timeout=3)
+        self.set_tftp_server(
+            tftp_server, config_load_method, tftp_path, username, password
+        )
+        self.snmp = snmp.Snmp(
+            self.ip, community_read, community_write, timeout=snmp_timeout
+        )
+        # параметры для создания отдельных экземпляров Snmp
+        self._snmp_args = (community_read, community_write, snmp_timeout)
         self.mgmt_vlan_name = mgmt_vlan_name
+        self.fingerprint_oids = fingerprint_oids
 
         self.chassis = service.Chassis()
         self.ports = service.Ports()
         self.eqp_type = None
         self.firmware = None
+        # поток определения набора портов, запущенный методом start_ports
+        self._ports_thread = None
+        # наблюдаемые задержки передачи (tftp) и сохранения (save)
+        # конфигурационного файла в секундах
+        self.latency = {}
+
+    def set_tftp_server(self,
+                        tftp_server,
+                        config_load_method='local',
+                        tftp_path='',
+                        username='',
+                        password='',
+                        **kwargs):
+        """
+        Метод выбора TFTP сервера для последующих передач файлов,
+        параметры аналогичны параметрам конструктора.
+        """
+
+        self.tftp_server = tftp_server
+        self.config_load_method = config_load_method
+        self.tftp_path = tftp_path
+        self.username = username
+        self.password = password
 
     def get_eqp_type(self):
         """
@@ -81,7 +219,7 @@ class Dlink(object):
                 '%s - запрос oid sysname выполнен успешно' % self.ip
             )
             eqp_type = str(snmp_result[0][1])
-            match = re.search(r'[A-z]+-\d+[A-z]*', eqp_type)
+            match = eqp_type_re.search(eqp_type)
             if match:
                 eqp_type = match.group()
             logger.info(
@@ -131,9 +269,50 @@ class Dlink(object):
             self.firmware = version
             return version
 
-    def get_ports(self):
+    def get_fingerprint(self):
+        """
+        Метод получения отпечатка состояния конфигурации оборудования,
+        состоящего из времени работы оборудования и значений oid'ов
+        признаков изменения конфигурации.
+
+        :rtype: словарь с отпечатком или None, если ни один признак
+                изменения конфигурации получить не удалось
+        """
+
+        # sysUpTime
+        oid_uptime = '1.3.6.1.2.1.1.3.0'
+
+        try:
+            uptime = int(self.snmp.get(oid_uptime)[0][1])
+        except snmp.SnmpException as snmp_exc:
+            logger.debug(snmp_exc)
+            return None
+
+        oids = {}
+
+        for oid in self.fingerprint_oids:
+            try:
+                oids[oid] = str(self.snmp.get(oid)[0][1])
+            except snmp.SnmpException as snmp_exc:
+                logger.debug(snmp_exc)
+
+        if not oids:
+            logger.debug(
+                '%s - признаки изменения конфигурации не получены' % self.ip
+            )
+            return None
+
+        return {
+            'uptime': uptime,
+            'oids': oids
+        }
+
+    def get_ports(self, snmp_client=None):
         """
         Метод получения количества физических портов целевого оборудования.
+
+        :param snmp_client: экземпляр Snmp для запросов, по умолчанию
+                            используется экземпляр оборудования
         """
 
         result = []
@@ -153,7 +332,7 @@ class Dlink(object):
             logger.info(
                 '%s - определение набора портов оборудования...' % self.ip
             )
-            snmp_result = self.snmp.next(*oids_interface)
+            snmp_result = (snmp_client or self.snmp).next(*oids_interface)
         except snmp.SnmpException as snmp_exc:
             logger.error(snmp_exc)
         else:
@@ -166,45 +345,130 @@ class Dlink(object):
                 # 6 - ethernetCsmacd
                 # 117 - gigabitEthernet
                 if int(_type) in [6, 117] and 'ch' not in str(name):
-                    port_index = int(index)
-                    port_tuple = service.ports_int_2_ports_tuple(port_index)
-                    port_str = service.ports_tuple_2_ports_str(
-                        *port_tuple
-                    )
-                    self.ports[port_index] = service.Port(port_str)
-                    self.ports[port_index]['port'] = port_index
-                    self.ports[port_index]['speed'] = int(speed / 1000000)
-                    # возможные статусы
-                    # 1: up
-                    # 2: down
-                    # 3: testing
-                    # 4: unknown
-                    # 5: dormant
-                    # 6: notPresent
-                    # 7: lowerLayerDown
-                    self.ports[port_index]['status'] = int(status)
-                    self.ports[port_index]['alias'] = str(alias)
-                    result += port_tuple
-
-            self.ports.ports_tuple = service.ports_tuple_minimize(*result)
+                    result.append({
+                        'port': int(index),
+                        'speed': int(speed / 1000000),
+                        # возможные статусы
+                        # 1: up
+                        # 2: down
+                        # 3: testing
+                        # 4: unknown
+                        # 5: dormant
+                        # 6: notPresent
+                        # 7: lowerLayerDown
+                        'status': int(status),
+                        'alias': str(alias)
+                    })
+
+            self.load_ports(result)
 
             logger.info(
                 '%s - набор портов оборудования определен успешно' % self.ip
             )
 
-    def get_config(self, timeout=10):
+    def start_ports(self):
+        """
+        Метод запуска определения набора портов в отдельном потоке.
+        Набор портов не зависит от конфигурационного файла, поэтому
+        опрос таблицы интерфейсов может выполняться во время передачи
+        файла. Поток использует отдельный экземпляр Snmp со своим
+        транспортом, набор портов ожидается методами, которые его
+        используют.
         """
-        Метод для получения конфигурационного файла целевого оборудования.
-        В методе определены oid'ы используемого оборудования.
-        Метод работает следующим образом - по snmp запрашивается oid_sysname
-        и по нему определяется тип оборудования, по типу оборудования
-        запрашиваются соответствующие oid и на указанный TFTP сервер
-        закачивается конфигурационный файл оборудования, далее он считывается
-        в виде строки и удаляется с сервера.
 
-        :param timeout: таймаут на получение конфигурационного файла
+        if self.ports or self._ports_thread:
+            return
 
-        :rtype: строка с конфигурационным файлом оборудования
+        community_read, community_write, timeout = self._snmp_args
+        snmp_client = snmp.Snmp(
+            self.ip, community_read, community_write, timeout=timeout
+        )
+
+        self._ports_thread = threading.Thread(
+            target=self.get_ports, args=(snmp_client, )
+        )
+        self._ports_thread.daemon = True
+        self._ports_thread.start()
+
+    def wait_ports(self):
+        """
+        Метод ожидания завершения потока определения набора портов.
+        """
+
+        if self._ports_thread:
+            self._ports_thread.join()
+            self._ports_thread = None
+
+    def load_ports(self, ports):
+        """
+        Метод заполнения набора портов оборудования из описаний портов,
+        полученных по snmp или сохраненных ранее методом dump_ports.
+
+        :param ports: массив словарей с ключами port, speed, status, alias
+        """
+
+        result = []
+
+        for item in ports:
+            port_index = item['port']
+            port_tuple = service.ports_int_2_ports_tuple(port_index)
+            port_str = service.ports_tuple_2_ports_str(*port_tuple)
+            self.ports[port_index] = service.Port(port_str)
+            self.ports[port_index]['port'] = port_index
+            self.ports[port_index]['speed'] = item['speed']
+            self.ports[port_index]['status'] = item['status']
+            self.ports[port_index]['alias'] = item['alias']
+            result += port_tuple
+
+        self.ports.ports_tuple = service.ports_tuple_minimize(*result)
+
+    def dump_ports(self):
+        """
+        Метод получения описаний портов оборудования для сохранения,
+        если набор портов еще не определен, он запрашивается по snmp.
+
+        :rtype: массив словарей с ключами port, speed, status, alias
+        """
+
+        self.wait_ports()
+        if not self.ports:
+            self.get_ports()
+
+        return [
+            {
+                'port': port['port'],
+                'speed': port['speed'],
+                'status': port['status'],
+                'alias': port['alias']
+            }
+            for port in self.ports
+        ]
+
+    def load_config(self, config, ports):
+        """
+        Метод загрузки сохраненного конфигурационного файла и набора
+        портов для анализа конфигурации без обращения к оборудованию.
+        Тип оборудования определяется по заголовку конфигурационного файла.
+
+        :param config: строка с конфигурационным файлом
+        :param ports: массив описаний портов, сохраненный методом dump_ports
+        """
+
+        match = eqp_type_re.search(config[:1024])
+        if not match:
+            raise DlinkConfigException(
+                self.ip, 'не удалось определить тип оборудования '
+                'по конфигурационному файлу'
+            )
+
+        self.eqp_type = match.group()
+        self.chassis.config_file = config.replace('\r\n', '\n')
+        self.load_ports(ports)
+
+    def _init_eqp(self):
+        """
+        Метод определения типа и версии прошивки оборудования,
+        необходимых для работы с файлами конфигурации.
         """
 
         try:
@@ -220,75 +484,225 @@ class Dlink(object):
                 self.ip, 'дальнейшая работа с оборудованием невозможна'
             )
 
-        cfg_file_name = 'config-%s.cfg' % self.ip
+    def _get_transfer_oids(self, file_name, download=False):
+        """
+        Метод получения набора oid'ов для передачи файла между
+        оборудованием и TFTP сервером.
+
+        :param file_name: имя файла на TFTP сервере
+        :param download: направление передачи, False - отдача
+                         конфигурационного файла на TFTP сервер,
+                         True - загрузка файла сценария с TFTP сервера
+                         и его выполнение
+        :rtype: кортеж из набора oid'ов для snmp set запроса, oid'а
+                состояния передачи, значений успешного и неуспешного
+                завершения передачи
+        """
 
         # набор oid'ов для конфигурации обрудования DES-3*** на отдачу
-        # конфигурационного файла на TFTP сервер
+        # конфигурационного файла на TFTP сервер или загрузку с него
         oids_des = (
-            ('1.3.6.1.4.1.171.12.1.2.1.1.3.3', IpAddress(self.tftp_server)),
-            ('1.3.6.1.4.1.171.12.1.2.1.1.4.3', Integer(2)),
-            ('1.3.6.1.4.1.171.12.1.2.1.1.5.3', OctetString(cfg_file_name)),
-            ('1.3.6.1.4.1.171.12.1.2.1.1.6.3', Integer(3)),
-            ('1.3.6.1.4.1.171.12.1.2.1.1.7.3', Integer(2)),
-            ('1.3.6.1.4.1.171.12.1.2.1.1.8.3', Integer(3))
+            ('1.3.6.1.4.1.171.12.1.2.1.1.3.3', rfc1902.IpAddress(self.tftp_server)),
+            ('1.3.6.1.4.1.171.12.1.2.1.1.4.3', rfc1902.Integer(2)),
+            ('1.3.6.1.4.1.171.12.1.2.1.1.5.3', rfc1902.OctetString(file_name)),
+            # 2 - загрузка, 3 - отдача
+            ('1.3.6.1.4.1.171.12.1.2.1.1.6.3', rfc1902.Integer(2 if download else 3)),
+            ('1.3.6.1.4.1.171.12.1.2.1.1.7.3', rfc1902.Integer(2)),
+            ('1.3.6.1.4.1.171.12.1.2.1.1.8.3', rfc1902.Integer(3))
         )
+        # состояние передачи: 3 - успешно, 4 - ошибка
+        status_des = ('1.3.6.1.4.1.171.12.1.2.1.1.9.3', (3, ), (4, ))
 
         # набор oid'ов для конфигурации обрудования DGS-3*** на отдачу
-        # конфигурационного файла на TFTP сервер
+        # конфигурационного файла на TFTP сервер или загрузку с него
         oids_dgs = (
-            ('1.3.6.1.4.1.171.12.1.2.18.1.1.3.3', IpAddress(self.tftp_server)),
-            ('1.3.6.1.4.1.171.12.1.2.18.1.1.5.3', OctetString(cfg_file_name)),
-            ('1.3.6.1.4.1.171.12.1.2.18.1.1.8.3', Integer(2)),
-            ('1.3.6.1.4.1.171.12.1.2.18.1.1.12.3', Integer(3))
+            ('1.3.6.1.4.1.171.12.1.2.18.1.1.3.3', rfc1902.IpAddress(self.tftp_server)),
+            ('1.3.6.1.4.1.171.12.1.2.18.1.1.5.3', rfc1902.OctetString(file_name)),
+            # 1 - загрузка, 2 - отдача
+            ('1.3.6.1.4.1.171.12.1.2.18.1.1.8.3', rfc1902.Integer(1 if download else 2)),
+            ('1.3.6.1.4.1.171.12.1.2.18.1.1.12.3', rfc1902.Integer(3))
         )
+        # состояние передачи: 3 - успешно, 4 - ошибка
+        status_dgs = ('1.3.6.1.4.1.171.12.1.2.18.1.1.13.3', (3, ), (4, ))
 
         # набор oid'ов для конфигурации обрудования DGS-3100 на отдачу
         # конфигурационного файла на TFTP сервер
         oids_tg = (
-            ('1.3.6.1.4.1.171.10.94.89.89.87.2.1.4.1', IpAddress(self.ip)),
-            ('1.3.6.1.4.1.171.10.94.89.89.87.2.1.5.1', Integer(1)),
-            ('1.3.6.1.4.1.171.10.94.89.89.87.2.1.6.1', OctetString('startupConfig')),
-            ('1.3.6.1.4.1.171.10.94.89.89.87.2.1.7.1', Integer(3)),
-            ('1.3.6.1.4.1.171.10.94.89.89.87.2.1.8.1', Integer(3)),
-            ('1.3.6.1.4.1.171.10.94.89.89.87.2.1.9.1', IpAddress(self.tftp_server)),
-            ('1.3.6.1.4.1.171.10.94.89.89.87.2.1.10.1', Integer(1)),
-            ('1.3.6.1.4.1.171.10.94.89.89.87.2.1.11.1', OctetString(cfg_file_name)),
-            ('1.3.6.1.4.1.171.10.94.89.89.87.2.1.12.1', Integer(3)),
-            ('1.3.6.1.4.1.171.10.94.89.89.87.2.1.17.1', Integer(4))
+            ('1.3.6.1.4.1.171.10.94.89.89.87.2.1.4.1', rfc1902.IpAddress(self.ip)),
+            ('1.3.6.1.4.1.171.10.94.89.89.87.2.1.5.1', rfc1902.Integer(1)),
+            ('1.3.6.1.4.1.171.10.94.89.89.87.2.1.6.1', rfc1902.OctetString('startupConfig')),
+            ('1.3.6.1.4.1.171.10.94.89.89.87.2.1.7.1', rfc1902.Integer(3)),
+            ('1.3.6.1.4.1.171.10.94.89.89.87.2.1.8.1', rfc1902.Integer(3)),
+            ('1.3.6.1.4.1.171.10.94.89.89.87.2.1.9.1', rfc1902.IpAddress(self.tftp_server)),
+            ('1.3.6.1.4.1.171.10.94.89.89.87.2.1.10.1', rfc1902.Integer(1)),
+            ('1.3.6.1.4.1.171.10.94.89.89.87.2.1.11.1', rfc1902.OctetString(file_name)),
+            ('1.3.6.1.4.1.171.10.94.89.89.87.2.1.12.1', rfc1902.Integer(3)),
+            ('1.3.6.1.4.1.171.10.94.89.89.87.2.1.17.1', rfc1902.Integer(4))
         )
 
-        cfg_file_end = 'End of configuration file'
+        # набор oid'ов для конфигурации обрудования DGS-3100 на загрузку
+        # файла сценария с TFTP сервера в текущую конфигурацию
+        oids_tg_download = (
+            ('1.3.6.1.4.1.171.10.94.89.89.87.2.1.3.1', rfc1902.Integer(3)),
+            ('1.3.6.1.4.1.171.10.94.89.89.87.2.1.4.1', rfc1902.IpAddress(self.tftp_server)),
+            ('1.3.6.1.4.1.171.10.94.89.89.87.2.1.6.1', rfc1902.OctetString(file_name)),
+            ('1.3.6.1.4.1.171.10.94.89.89.87.2.1.7.1', rfc1902.Integer(3)),
+            ('1.3.6.1.4.1.171.10.94.89.89.87.2.1.8.1', rfc1902.Integer(1)),
+            ('1.3.6.1.4.1.171.10.94.89.89.87.2.1.10.1', rfc1902.Integer(1)),
+            ('1.3.6.1.4.1.171.10.94.89.89.87.2.1.12.1', rfc1902.Integer(2)),
+            ('1.3.6.1.4.1.171.10.94.89.89.87.2.1.17.1', rfc1902.Integer(4))
+        )
+        # rlCopyOperationState: 3 - успешно, 4 и 5 - ошибка
+        status_tg = ('1.3.6.1.4.1.171.10.94.89.89.87.2.1.18.1', (3, ), (4, 5))
 
         # TG
         if 'DGS-3100' in self.eqp_type:
-            current_eqp = oids_tg
-            # переопределяем окончание конфигурационного файла для
-            # оборудования DGS-3100
-            cfg_file_end = '! VOICE VLAN'
+            if download:
+                return (oids_tg_download, ) + status_tg
+            else:
+                return (oids_tg, ) + status_tg
         # DES-3526, DES-3528, DES-3010G, DGS-3200
         elif 'DES-3526' in self.eqp_type \
                 or 'DES-3528' in self.eqp_type \
                 or 'DES-3010G' in self.eqp_type \
                 or 'DGS-3200' in self.eqp_type:
-            current_eqp = oids_des
+            return (oids_des, ) + status_des
         # DGS
         elif 'DGS-3' in self.eqp_type:
-            current_eqp = oids_dgs
+            return (oids_dgs, ) + status_dgs
         # DES
         elif 'DES-3' in self.eqp_type:
-            if self.firmware:
-                if float(self.firmware[:4]) >= 4.00:
-                    current_eqp = oids_dgs
-                else:
-                    current_eqp = oids_des
+            if self.firmware and float(self.firmware[:4]) >= 4.00:
+                return (oids_dgs, ) + status_dgs
             else:
-                current_eqp = oids_des
+                return (oids_des, ) + status_des
         else:
             raise DlinkConfigException(
                 self.ip, 'не удалось определить нужный набор oid '
-                'для настройки оборудования на отдачу конфигурационного файла'
+                'для обмена файлами с TFTP сервером'
+            )
+
+    def _open_tftp_storage(self):
+        """
+        Метод получения функций для работы с файлами в папке TFTP сервера
+        в соответствии с методом загрузки конфигурационного файла.
+
+        :rtype: кортеж из функций открытия файла, удаления файла и
+                закрытия соединения
+        """
+
+        if self.config_load_method == 'local':
+            return open, os.remove, lambda: None
+
+        elif self.config_load_method == 'ssh':
+            key = (self.tftp_server, self.username)
+
+            with _ssh_lock:
+                ssh = _ssh_idle[key].pop() if _ssh_idle[key] else None
+
+            sftp = None
+            if ssh is not None:
+                try:
+                    sftp = ssh.open_sftp()
+                except (paramiko.SSHException, socket.error) as exc:
+                    logger.debug(
+                        '%s - ssh соединение с сервером %s закрыто - %s'
+                        % (self.ip, self.tftp_server, exc)
+                    )
+                    ssh.close()
+
+            if sftp is None:
+                ssh = paramiko.SSHClient()
+                ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+                ssh.load_system_host_keys()
+
+                try:
+                    with metrics.measure('ssh_connect'):
+                        ssh.connect(
+                            self.tftp_server,
+                            username=self.username,
+                            password=self.password
+                        )
+                        sftp = ssh.open_sftp()
+                except (paramiko.SSHException, socket.error) as exc:
+                    logger.error(
+                        '%s - %s' % (self.ip, exc)
+                    )
+                    raise DlinkTftpException(
+                        self.ip, 'не удалось подключиться к серверу %s '
+                        'по протоколу ssh' % self.tftp_server
+                    )
+
+            def release():
+                sftp.close()
+                with _ssh_lock:
+                    _ssh_idle[key].append(ssh)
+
+            return sftp.open, sftp.remove, release
+
+        else:
+            raise DlinkConfigException(
+                self.ip, 'неверно указан метод загрузки конфигурационного файла'
             )
 
+    def _wait_transfer(self, status_oid, done, failed, timeout):
+        """
+        Метод ожидания завершения передачи файла путем опроса
+        oid'а состояния передачи.
+
+        :param status_oid: oid состояния передачи
+        :param done: значения успешного завершения передачи
+        :param failed: значения неуспешного завершения передачи
+        :param timeout: таймаут ожидания в секундах
+        """
+
+        for _c in xrange(timeout):
+            time.sleep(1)
+            try:
+                status = int(self.snmp.get(status_oid)[0][1])
+            except snmp.SnmpException as snmp_exc:
+                logger.debug(snmp_exc)
+                continue
+            if status in done:
+                return
+            elif status in failed:
+                raise DlinkConfigException(
+                    self.ip, 'оборудование сообщило об ошибке передачи '
+                    'файла, состояние - %s' % status
+                )
+
+        raise DlinkConfigException(
+            self.ip, 'передача файла не завершена за %s секунд' % timeout
+        )
+
+    def get_config(self, timeout=10):
+        """
+        Метод для получения конфигурационного файла целевого оборудования.
+        В методе определены oid'ы используемого оборудования.
+        Метод работает следующим образом - по snmp запрашивается oid_sysname
+        и по нему определяется тип оборудования, по типу оборудования
+        запрашиваются соответствующие oid и на указанный TFTP сервер
+        закачивается конфигурационный файл оборудования, далее он считывается
+        в виде строки и удаляется с сервера.
+
+        :param timeout: таймаут на получение конфигурационного файла
+
+        :rtype: строка с конфигурационным файлом оборудования
+        """
+
+        self._init_eqp()
+
+        cfg_file_name = 'config-%s.cfg' % self.ip
+
+        cfg_file_end = 'End of configuration file'
+
+        if 'DGS-3100' in self.eqp_type:
+            # переопределяем окончание конфигурационного файла для
+            # оборудования DGS-3100
+            cfg_file_end = '! VOICE VLAN'
+
+        current_eqp = self._get_transfer_oids(cfg_file_name)[0]
+
         # получаем конфиг, если определить тип оборудование не получилось,
         # то выводим соответствующее сообщение
         try:
@@ -306,94 +720,180 @@ class Dlink(object):
         )
 
         result = None
+        start = time.time()
 
         file_path = os.path.join(self.tftp_path, cfg_file_name)
 
-        if self.config_load_method == 'local':
-            open_func = open
-            rm_func = os.remove
-            conn_close_func = lambda: None
+        open_func, rm_func, conn_close_func = self._open_tftp_storage()
 
-        elif self.config_load_method == 'ssh':
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            ssh.load_system_host_keys()
+        # ожидание передачи файла на TFTP сервер
+        with metrics.measure('tftp_wait'):
+            _c = 0
+
+            while 1:
+                time.sleep(1)
+                if _c < timeout:
+                    try:
+                        _f = open_func(file_path, mode='r')
+                    # обработка ситуации когда файл еще не создан
+                    except IOError as io_exc:
+                        _c += 1
+                    else:
+                        cfg_file = _f.read()
+                        if cfg_file_end in cfg_file:
+                            _f.close()
+                            rm_func(file_path)
+                            conn_close_func()
+                            result = cfg_file.replace('\r\n', '\n')
+                            self.latency['tftp'] = time.time() - start
+                            break
+                        else:
+                            end_not_obtained = True
+                            _c += 1
+                            _f.close()
+                else:
+                    conn_close_func()
+
+                    if 'io_exc' in locals():
+                        raise DlinkTftpException(
+                            self.ip, 'конфигурационного файла %s не '
+                            'существует на сервере %s' %
+                            (file_path, self.tftp_server)
+                        )
+                    elif 'end_not_obtained' in locals():
+                        raise DlinkTftpException(
+                            self.ip, 'конец файла %s не получен за %s секунд' %
+                            (file_path, timeout)
+                        )
+                    else:
+                        raise DlinkTftpException(
+                            self.ip, 'не удалось получить конфигурационный '
+                            'файл %s с сервера %s по неизвестной причине' %
+                            (file_path, self.tftp_server)
+                        )
+
+        logger.info(
+            '%s - конфигурационный файла получен успешно' % self.ip
+        )
+        self.chassis.config_file = result
+        return result
+
+    def load_commands(self, commands, timeout=30):
+        """
+        Метод выполнения набора команд на оборудовании одним файлом
+        сценария. Команды записываются в файл в папке TFTP сервера,
+        оборудование по snmp настраивается на загрузку и выполнение
+        этого файла, окончание выполнения определяется опросом
+        состояния передачи.
+
+        :param commands: массив строк команд
+        :param timeout: таймаут на загрузку и выполнение файла сценария
+        """
+
+        self._init_eqp()
+
+        script_file_name = 'script-%s.cfg' % self.ip
+        file_path = os.path.join(self.tftp_path, script_file_name)
+
+        current_eqp, status_oid, done, failed = self._get_transfer_oids(
+            script_file_name, download=True
+        )
+
+        open_func, rm_func, conn_close_func = self._open_tftp_storage()
 
+        try:
             try:
-                ssh.connect(
-                    self.tftp_server,
-                    username=self.username,
-                    password=self.password
-                )
-            except socket.error as exc:
-                logger.error(
-                    '%s - %s' % (self.ip, exc)
+                _f = open_func(file_path, mode='w')
+                try:
+                    _f.write(''.join('%s\n' % cmd for cmd in commands))
+                finally:
+                    _f.close()
+            except IOError as exc:
+                logger.error('%s - %s' % (self.ip, exc))
+                raise DlinkTftpException(
+                    self.ip, 'не удалось записать файл сценария %s на '
+                    'сервер %s' % (file_path, self.tftp_server)
                 )
+
+            try:
+                self.snmp.set(*current_eqp)
+            except snmp.SnmpException as snmp_exc:
+                logger.critical(snmp_exc)
                 raise DlinkConfigException(
-                    self.ip, 'не удалось подключиться к серверу %s'
-                    'по протоколу ssh' % self.tftp_server
+                    self.ip, 'не удалось настроить оборудование на загрузку '
+                    'файла сценария'
                 )
 
-            sftp = ssh.open_sftp()
+            logger.debug(
+                '%s - оборудование настроено на загрузку файла сценария '
+                'успешно' % self.ip
+            )
 
-            open_func = sftp.open
-            rm_func = sftp.remove
-            conn_close_func = ssh.close
+            with metrics.measure('script'):
+                self._wait_transfer(status_oid, done, failed, timeout)
 
+        finally:
+            try:
+                rm_func(file_path)
+            except (IOError, OSError):
+                pass
+            conn_close_func()
+
+        logger.info(
+            '%s - файл сценария из %s команд выполнен успешно'
+            % (self.ip, len(commands))
+        )
+
+    @metrics.timed('save')
+    def save_config(self, timeout=15):
+        """
+        Метод сохранения конфигурационного файла оборудования по snmp.
+
+        :param timeout: таймаут на сохранение конфигурационного файла
+        """
+
+        self._init_eqp()
+
+        if 'DGS-3100' in self.eqp_type:
+            # копирование текущей конфигурации в загрузочную
+            oids_save = (
+                ('1.3.6.1.4.1.171.10.94.89.89.87.2.1.3.1', rfc1902.Integer(1)),
+                ('1.3.6.1.4.1.171.10.94.89.89.87.2.1.5.1', rfc1902.Integer(1)),
+                ('1.3.6.1.4.1.171.10.94.89.89.87.2.1.7.1', rfc1902.Integer(2)),
+                ('1.3.6.1.4.1.171.10.94.89.89.87.2.1.8.1', rfc1902.Integer(1)),
+                ('1.3.6.1.4.1.171.10.94.89.89.87.2.1.10.1', rfc1902.Integer(1)),
+                ('1.3.6.1.4.1.171.10.94.89.89.87.2.1.12.1', rfc1902.Integer(3)),
+                ('1.3.6.1.4.1.171.10.94.89.89.87.2.1.17.1', rfc1902.Integer(4))
+            )
+            status_oid, done, failed = (
+                '1.3.6.1.4.1.171.10.94.89.89.87.2.1.18.1', (3, ), (4, 5)
+            )
         else:
-            raise DlinkConfigException(
-                self.ip, 'неверно указан метод загрузки конфигурационного файла'
+            # agentSaveCfg: 3 - сохранить конфигурацию,
+            # по окончании значение сбрасывается в 1
+            oids_save = (
+                ('1.3.6.1.4.1.171.12.1.2.6.0', rfc1902.Integer(3)),
             )
+            status_oid, done, failed = ('1.3.6.1.4.1.171.12.1.2.6.0', (1, ), ())
 
-        _c = 0
+        start = time.time()
 
-        while 1:
-            time.sleep(1)
-            if _c < timeout:
-                try:
-                    _f = open_func(file_path, mode='r')
-                # обработка ситуации когда файл еще не создан
-                except IOError as io_exc:
-                    _c += 1
-                else:
-                    cfg_file = _f.read()
-                    if cfg_file_end in cfg_file:
-                        _f.close()
-                        rm_func(file_path)
-                        conn_close_func()
-                        result = cfg_file.replace('\r\n', '\n')
-                        break
-                    else:
-                        end_not_obtained = True
-                        _c += 1
-                        _f.close()
-            else:
-                conn_close_func()
+        try:
+            self.snmp.set(*oids_save)
+        except snmp.SnmpException as snmp_exc:
+            logger.critical(snmp_exc)
+            raise DlinkConfigException(
+                self.ip, 'не удалось сохранить конфигурационный файл'
+            )
 
-                if 'io_exc' in locals():
-                    raise DlinkConfigException(
-                        self.ip, 'конфигурационного файла %s не существует '
-                        'на сервере %s' %
-                        (file_path, self.tftp_server)
-                    )
-                elif 'end_not_obtained' in locals():
-                    raise DlinkConfigException(
-                        self.ip, 'конец файла %s не получен за %s секунд' %
-                        (file_path, timeout)
-                    )
-                else:
-                    raise DlinkConfigException(
-                        self.ip, 'не удалось получить конфигурационный файл '
-                        '%s с сервера %s по неизвестной причине' %
-                        (file_path, self.tftp_server)
-                    )
+        self._wait_transfer(status_oid, done, failed, timeout)
+        self.latency['save'] = time.time() - start
 
         logger.info(
-            '%s - конфигурационный файла получен успешно' % self.ip
+            '%s - конфигурационный файл успешно сохранен' % self.ip
         )
-        self.chassis.config_file = result
-        return result
 
+    @metrics.timed('parse')
     def parse_config(self):
         """
         Метод парсинга конфигурационного файла по
@@ -403,6 +903,7 @@ class Dlink(object):
         if not self.chassis.config_file:
             self.get_config()
 
+        self.wait_ports()
         if not self.ports:
             self.get_ports()
 
@@ -594,20 +1095,289 @@ class Dlink(object):
             '%s - парсинг закончен' % self.ip
         )
 
-    def analyze_config(self, option_dict):
+    def get_state(self):
+        """
+        Метод получения состояния ключевых опций оборудования по snmp,
+        без получения и парсинга конфигурационного файла.
+        Заполняет те же структуры, что и метод parse_config. Опции, для
+        которых нет соответствия в mib или которые не поддерживаются
+        оборудованием, остаются незаполненными. Опции snmp_unsupported
+        по snmp не определяются вовсе.
+        """
+
+        self.wait_ports()
+        if not self.ports:
+            self.get_ports()
+
+        if not self.ports:
+            raise DlinkConfigException(
+                self.ip, 'не удалось определить набор портов оборудования'
+            )
+
+        logger.info(
+            '%s - получение состояния опций по snmp...' % self.ip
+        )
+
+        # vlan
+        try:
+            snmp_result = self.snmp.bulk(
+                mib.vlan_static_name,
+                mib.vlan_static_egress_ports,
+                mib.vlan_static_untagged_ports
+            )
+        except snmp.SnmpException as snmp_exc:
+            logger.error(snmp_exc)
+            raise DlinkConfigException(
+                self.ip, 'не удалось получить набор vlan оборудования'
+            )
+
+        self.chassis.vlan = {}
+        for port in self.ports:
+            port.vlan = {}
+
+        for (vlan_oid, name), (_o, egress), (_o, untagged) in snmp_result:
+            name = str(name)
+            tag = str(vlan_oid[-1])
+            self.chassis.vlan[name] = {'tag': tag}
+
+            untagged = service.ports_bitmap_2_ports_int(str(untagged))
+            # номера портов в битовой маске совпадают с индексами
+            # интерфейсов физических портов
+            for port_id in service.ports_bitmap_2_ports_int(str(egress)):
+                try:
+                    port = self.ports[port_id]
+                except KeyError:
+                    continue
+                port.vlan[name] = {
+                    'tag': tag,
+                    'type': 'untagged' if port_id in untagged else 'tagged'
+                }
+
+        # опции портов
+        for (key, option), (oid, values) in mib.port_options.iteritems():
+            try:
+                snmp_result = self.snmp.bulk(oid)
+            except snmp.SnmpException as snmp_exc:
+                logger.debug(snmp_exc)
+                continue
+
+            for ((port_oid, value), ) in snmp_result:
+                try:
+                    port = self.ports[int(port_oid[-1])]
+                    port[key][option] = mib.value_2_option(value, values)
+                except (KeyError, ValueError, TypeError):
+                    continue
+
+        # глобальные опции
+        for (key, option), (oid, values) in mib.chassis_options.iteritems():
+            try:
+                snmp_result = self.snmp.get(oid)
+                value = mib.value_2_option(snmp_result[0][1], values)
+            except snmp.SnmpException as snmp_exc:
+                logger.debug(snmp_exc)
+            except (ValueError, TypeError):
+                pass
+            else:
+                self.chassis.add_option(key, {option: value})
+
+        try:
+            snmp_result = self.snmp.get(mib.stp_priority)
+            priority = mib.value_2_option(snmp_result[0][1])
+        except snmp.SnmpException as snmp_exc:
+            logger.debug(snmp_exc)
+        except (ValueError, TypeError):
+            pass
+        else:
+            self.chassis.stp['instance_id'] = {'0': {'priority': priority}}
+
+        for port in self.ports:
+            port.define_port_type(self.mgmt_vlan_name)
+
+        logger.info(
+            '%s - состояние опций получено успешно' % self.ip
+        )
+
+    def _get_command_oids(self, cmd):
+        """
+        Метод преобразования команды в набор oid'ов для snmp set запроса.
+
+        :param cmd: строка команды
+        :rtype: массив кортежей из oid'а и значения или None, если
+                соответствие команды объектам mib не определено
+        """
+
+        words = cmd.split()
+
+        try:
+            # config <key> ports <ports> <option> <value>
+            if len(words) == 6 and words[0] == 'config' \
+                    and words[2] == 'ports':
+                _c, key, _p, ports, option, value = words
+                oid, values = mib.port_options[(key, option)]
+                value = rfc1902.Integer(mib.option_2_value(value, values))
+                return [
+                    ('%s.%s' % (oid, port_id), value)
+                    for port_id in service.ports_str_2_ports_int(ports)
+                ]
+
+            # config stp priority <value> instance_id 0
+            elif words[:3] == ['config', 'stp', 'priority'] \
+                    and words[4:] == ['instance_id', '0']:
+                return [(mib.stp_priority, rfc1902.Integer(int(words[3])))]
+
+            # enable <key>, disable <key>
+            elif len(words) == 2 and words[0] in ['enable', 'disable']:
+                oid, values = mib.chassis_options[(words[1], 'state')]
+                return [(oid, rfc1902.Integer(mib.option_2_value(words[0], values)))]
+
+            # config <key> <option> <value>
+            elif len(words) == 4 and words[0] == 'config':
+                _c, key, option, value = words
+                oid, values = mib.chassis_options[(key, option)]
+                return [(oid, rfc1902.Integer(mib.option_2_value(value, values)))]
+
+        except (KeyError, ValueError):
+            pass
+
+        return None
+
+    def set_options(self, commands, max_var_binds=32):
+        """
+        Метод применения команд на оборудовании с помощью snmp set
+        запросов. Команды, для которых определено соответствие объектам
+        mib, объединяются в запросы, содержащие не более max_var_binds
+        oid'ов (oid'ы одной команды передаются одним запросом, а если
+        не помещаются в него - несколькими запросами только этой команды),
+        остальные команды, а также команды из неуспешных запросов,
+        возвращаются для выполнения другим способом.
+
+        :param commands: массив строк команд
+        :param max_var_binds: максимальное количество oid'ов в одном запросе
+        :rtype: массив строк невыполненных команд
+        """
+
+        result = []
+        # команды, для которых определено соответствие объектам mib
+        mapped = []
+        # массив запросов, каждый запрос состоит из
+        # массива команд и массива oid'ов
+        requests = []
+        # последний запрос содержит часть oid'ов одной команды
+        split = False
+
+        for cmd in commands:
+            oids = self._get_command_oids(cmd)
+            if not oids:
+                result.append(cmd)
+                continue
+
+            mapped.append(cmd)
+
+            if len(oids) > max_var_binds:
+                for i in xrange(0, len(oids), max_var_binds):
+                    requests.append(([cmd], oids[i:i + max_var_binds]))
+                split = True
+                continue
+
+            if not requests or split or \
+                    len(requests[-1][1]) + len(oids) > max_var_binds:
+                requests.append(([], []))
+                split = False
+            requests[-1][0].append(cmd)
+            requests[-1][1].extend(oids)
+
+        failed = set()
+
+        for cmds, oids in requests:
+            # предыдущая часть oid'ов команды не применена
+            if failed.issuperset(cmds):
+                continue
+            try:
+                self.snmp.set(*oids)
+            except snmp.SnmpException as snmp_exc:
+                logger.warning(snmp_exc)
+                failed.update(cmds)
+
+        for cmd in mapped:
+            if cmd in failed:
+                result.append(cmd)
+            else:
+                logger.info(
+                    '%s - %s - команда выполнена успешно' % (self.ip, cmd)
+                )
+
+        logger.info(
+            '%s - по snmp выполнено %s команд из %s' %
+            (self.ip, len(commands) - len(result), len(commands))
+        )
+
+        return result
+
+    def get_state_digest(self):
+        """
+        Метод получения хэша состояния опций оборудования, от которого
+        зависят команды настройки. Имена, индексы, скорости, статусы и
+        описания портов не учитываются, порты учитываются по порядку.
+
+        :rtype: строка
+        """
+
+        chassis = dict(
+            (k, v) for k, v in self.chassis.__dict__.iteritems()
+            if k != 'config_file'
+        )
+        ports = [
+            dict(
+                (k, v) for k, v in port.__dict__.iteritems()
+                if k not in ['name', 'port', 'speed', 'status', 'alias']
+            )
+            for port in self.ports
+        ]
+
+        return hashlib.sha1(
+            json.dumps([chassis, ports], sort_keys=True)
+        ).hexdigest()
+
+    def analyze_config(self, option_dict, source='config', cache=None):
         """
         Метод анализа конфигурационного файла и формирования
         команд на основе словаря настроек.
 
         :param option_dict: словарь с настройками оборудования
+        :param source: источник состояния опций оборудования:
+                       config - парсинг конфигурационного файла,
+                       snmp - опрос оборудования по snmp
+        :param cache: словарь для запоминания команд оборудования
+                      с одинаковыми типом, состоянием опций и настройками
 
         :rtype: массив строк
         """
 
-        self.parse_config()
+        if source == 'snmp':
+            self.get_state()
+            option_dict = without_snmp_unsupported(self.ip, option_dict)
+        else:
+            self.parse_config()
+
+        with metrics.measure('plan'):
+            if cache is not None:
+                key = (
+                    self.eqp_type,
+                    self.get_state_digest(),
+                    hashlib.sha1(
+                        json.dumps(option_dict, sort_keys=True)
+                    ).hexdigest()
+                )
+                if key in cache:
+                    return list(cache[key])
+
+            commands = self.ports.get_commands(option_dict, self.eqp_type) + \
+                       self.chassis.get_commands(option_dict)
+
+            if cache is not None:
+                cache[key] = tuple(commands)
 
-        return self.ports.get_commands(option_dict, self.eqp_type) + \
-               self.chassis.get_commands(option_dict)
+        return commands
 
 
 class DlinkException(service.BasicException):
@@ -629,3 +1399,11 @@ class DlinkConfigException(DlinkException):
     Исключение получения конфигурационного файла оборудования.
     """
     pass
+
+
+class DlinkTftpException(DlinkConfigException):
+    """
+    Исключение передачи файла, вызванное TFTP сервером, передачу
+    можно повторить через другой сервер.
+    """
+    pass
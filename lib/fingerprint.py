@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Хранение отпечатков состояния конфигурации оборудования рядом с
+сохраненными конфигурационными файлами. Отпечаток позволяет не получать
+конфигурационный файл повторно, если конфигурация оборудования
+не изменялась с момента предыдущего сохранения.
+"""
+
+
+import json
+import os
+
+
+suffix = '.fingerprint'
+
+
+def load(path):
+    """
+    Функция чтения отпечатка, сохраненного для конфигурационного файла.
+
+    :param path: путь к конфигурационному файлу
+    :rtype: словарь с отпечатком или None
+    """
+
+    try:
+        with open(path + suffix, 'r') as _f:
+            return json.load(_f)
+    except (IOError, ValueError):
+        return None
+
+
+def dump(path, fingerprint):
+    """
+    Функция сохранения отпечатка для конфигурационного файла.
+    Если отпечаток не получен, ранее сохраненный отпечаток удаляется.
+
+    :param path: путь к конфигурационному файлу
+    :param fingerprint: словарь с отпечатком или None
+    """
+
+    if fingerprint is None:
+        try:
+            os.remove(path + suffix)
+        except OSError:
+            pass
+    else:
+        with open(path + suffix, 'w') as _f:
+            json.dump(fingerprint, _f)
+
+
+def is_unchanged(old, new):
+    """
+    Функция сравнения отпечатков. Конфигурация считается неизменной,
+    если совпадают все признаки изменения конфигурации и оборудование
+    не перезагружалось между получением отпечатков.
+
+    :param old: сохраненный отпечаток
+    :param new: текущий отпечаток
+    :rtype: булево значение
+    """
+
+    if not old or not new:
+        return False
+
+    return old.get('oids') == new['oids'] and \
+        old.get('uptime', 0) <= new['uptime']
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+История конфигурационных файлов оборудования.
+
+Для каждого оборудования хранятся периодические полные копии
+конфигурационного файла и построчные изменения (дельты) относительно
+предыдущей версии, поэтому восстановление любой версии требует чтения
+не более одной полной копии и snapshot_interval дельт.
+
+Структура папки истории:
+    devices/<ip>/data - последовательность сжатых записей версий
+    devices/<ip>/index - по одной строке на версию:
+        <время> <тип записи F|D> <смещение> <длина> <sha1>
+    days/<ГГГГ-ММ-ДД> - журнал изменений всего оборудования за сутки (UTC):
+        <время> <ip> <sha1>
+"""
+
+
+import bisect
+import collections
+import difflib
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+
+
+Version = collections.namedtuple(
+    'Version', ['timestamp', 'kind', 'offset', 'length', 'digest']
+)
+
+
+class History(object):
+    """
+    Класс для работы с историей конфигурационных файлов.
+    """
+
+    def __init__(self, path, snapshot_interval=30):
+        """
+        Конструктор класса.
+
+        :param path: путь к папке истории
+        :param snapshot_interval: максимальное количество дельт между
+                                  полными копиями конфигурационного файла
+        """
+
+        self.path = path
+        self.snapshot_interval = snapshot_interval
+        self._lock = threading.Lock()
+        self._device_locks = collections.defaultdict(threading.Lock)
+
+        for name in ['devices', 'days']:
+            dir_path = os.path.join(self.path, name)
+            if not os.path.isdir(dir_path):
+                try:
+                    os.makedirs(dir_path)
+                except OSError as exc:
+                    raise HistoryException(exc)
+
+    def _device_path(self, ip, name):
+        return os.path.join(self.path, 'devices', ip, name)
+
+    def get_versions(self, ip):
+        """
+        Метод получения списка версий конфигурационного файла оборудования.
+
+        :param ip: ip адрес оборудования
+        :rtype: массив Version, упорядоченный по времени
+        """
+
+        try:
+            with open(self._device_path(ip, 'index'), 'r') as _f:
+                return [
+                    Version(int(ts), kind, int(offset), int(length), digest)
+                    for ts, kind, offset, length, digest in
+                    (line.split() for line in _f)
+                ]
+        except IOError:
+            return []
+        except ValueError as exc:
+            raise HistoryException('%s - поврежден индекс - %s' % (ip, exc))
+
+    def _read_record(self, ip, version):
+        """
+        Метод чтения и распаковки записи версии.
+
+        :param ip: ip адрес оборудования
+        :param version: экземпляр Version
+        :rtype: массив строк для полной копии или массив операций для дельты
+        """
+
+        with open(self._device_path(ip, 'data'), 'rb') as _f:
+            _f.seek(version.offset)
+            record = json.loads(zlib.decompress(_f.read(version.length)))
+
+        # строки конфигурационного файла хранятся как latin-1, чтобы
+        # любые байты восстанавливались без изменений
+        if version.kind == 'F':
+            return [line.encode('latin-1') for line in record]
+        else:
+            return [
+                op if op[0] == '=' else
+                (op[0], [line.encode('latin-1') for line in op[1]])
+                for op in record
+            ]
+
+    @staticmethod
+    def _apply(lines, record):
+        """
+        Метод применения дельты к предыдущей версии.
+
+        :param lines: массив строк предыдущей версии
+        :param record: массив операций дельты
+        :rtype: массив строк
+        """
+
+        result = []
+        for op in record:
+            if op[0] == '=':
+                result.extend(lines[op[1]:op[2]])
+            else:
+                result.extend(op[1])
+
+        return result
+
+    def _restore(self, ip, versions, index):
+        """
+        Метод восстановления версии конфигурационного файла
+        по ближайшей предшествующей полной копии и дельтам.
+
+        :param ip: ip адрес оборудования
+        :param versions: массив Version
+        :param index: номер восстанавливаемой версии
+        :rtype: массив строк
+        """
+
+        start = index
+        while versions[start].kind != 'F':
+            start -= 1
+
+        lines = self._read_record(ip, versions[start])
+
+        for version in versions[start + 1:index + 1]:
+            lines = self._apply(lines, self._read_record(ip, version))
+
+        return lines
+
+    def get(self, ip, timestamp=None):
+        """
+        Метод получения конфигурационного файла оборудования на момент
+        времени.
+
+        :param ip: ip адрес оборудования
+        :param timestamp: время в секундах от начала эпохи, если не указано -
+                          последняя версия
+        :rtype: строка с конфигурационным файлом или None, если на указанный
+                момент времени версий нет
+        """
+
+        versions = self.get_versions(ip)
+
+        if timestamp is None:
+            index = len(versions) - 1
+        else:
+            index = bisect.bisect_right(
+                [v.timestamp for v in versions], timestamp
+            ) - 1
+
+        if index < 0:
+            return None
+
+        return ''.join(self._restore(ip, versions, index))
+
+    def put(self, ip, config, timestamp=None):
+        """
+        Метод добавления версии конфигурационного файла оборудования.
+        Если конфигурационный файл не изменился, версия не добавляется.
+
+        :param ip: ip адрес оборудования
+        :param config: строка с конфигурационным файлом
+        :param timestamp: время в секундах от начала эпохи
+        :rtype: булево значение - была ли добавлена версия
+        """
+
+        if timestamp is None:
+            timestamp = int(time.time())
+
+        digest = hashlib.sha1(config).hexdigest()
+        lines = config.splitlines(True)
+
+        with self._device_locks[ip]:
+            versions = self.get_versions(ip)
+
+            if versions and versions[-1].digest == digest:
+                return False
+
+            since_snapshot = 0
+            for version in reversed(versions):
+                if version.kind == 'F':
+                    break
+                since_snapshot += 1
+
+            if not versions or since_snapshot >= self.snapshot_interval:
+                kind = 'F'
+                record = lines
+            else:
+                kind = 'D'
+                prev_lines = self._restore(ip, versions, len(versions) - 1)
+                matcher = difflib.SequenceMatcher(
+                    None, prev_lines, lines, autojunk=False
+                )
+                record = []
+                for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+                    if tag == 'equal':
+                        record.append(('=', i1, i2))
+                    elif j2 > j1:
+                        record.append(('+', lines[j1:j2]))
+
+            data = zlib.compress(json.dumps(record, encoding='latin-1'))
+
+            try:
+                dir_path = os.path.dirname(self._device_path(ip, 'data'))
+                if not os.path.isdir(dir_path):
+                    os.makedirs(dir_path)
+
+                with open(self._device_path(ip, 'data'), 'ab') as _f:
+                    _f.seek(0, os.SEEK_END)
+                    offset = _f.tell()
+                    _f.write(data)
+
+                with open(self._device_path(ip, 'index'), 'a') as _f:
+                    _f.write('%d %s %d %d %s\n' % (
+                        timestamp, kind, offset, len(data), digest
+                    ))
+
+                day = time.strftime('%Y-%m-%d', time.gmtime(timestamp))
+                with self._lock:
+                    with open(os.path.join(self.path, 'days', day), 'a') as _f:
+                        _f.write('%d %s %s\n' % (timestamp, ip, digest))
+
+            except EnvironmentError as exc:
+                raise HistoryException(exc)
+
+        return True
+
+    def changes(self, day):
+        """
+        Генератор изменений конфигурационных файлов всего оборудования
+        за сутки. Восстанавливаются только изменившиеся версии и
+        предшествующие им версии того же оборудования.
+
+        :param day: строка с датой в формате ГГГГ-ММ-ДД (UTC)
+        :rtype: итератор кортежей из времени, ip адреса и итератора строк
+                изменений в формате unified diff
+        """
+
+        try:
+            _f = open(os.path.join(self.path, 'days', day), 'r')
+        except IOError:
+            return
+
+        with _f:
+            for line in _f:
+                timestamp, ip, digest = line.split()
+                timestamp = int(timestamp)
+
+                versions = self.get_versions(ip)
+                for index in xrange(len(versions) - 1, -1, -1):
+                    if versions[index].timestamp == timestamp and \
+                            versions[index].digest == digest:
+                        break
+                else:
+                    continue
+
+                if index:
+                    old_lines = self._restore(ip, versions, index - 1)
+                else:
+                    old_lines = []
+
+                if versions[index].kind == 'D':
+                    new_lines = self._apply(
+                        old_lines, self._read_record(ip, versions[index])
+                    )
+                else:
+                    new_lines = self._read_record(ip, versions[index])
+
+                yield timestamp, ip, difflib.unified_diff(
+                    old_lines, new_lines, ip, ip
+                )
+
+
+class HistoryException(Exception):
+    """
+    Базовое исключение.
+    """
+    pass
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Индекс опций оборудования в базе SQLite.
+
+Разобранные глобальные опции и опции портов всего оборудования хранятся
+построчно, поэтому вопросы вида "на каких access портах выключен
+loopdetect" решаются запросом к индексу без повторного парсинга
+конфигурационных файлов. Записи оборудования обновляются только при
+изменении хэша его конфигурационного файла и набора портов.
+
+Структура базы:
+    devices - ip, eqp_type, config_hash, updated
+    ports - ip, port, name, port_type (0 - trunk, 1 - access)
+    options - ip, port (0 - глобальная опция), key, option, value,
+              вложенные опции разворачиваются в option через точку:
+              vlan mgmt.tag, stp instance_id.0.priority
+"""
+
+
+import sqlite3
+import threading
+import time
+
+import service
+
+
+# ключи опций, сохраняемые в индексе
+keys = [
+    'vlan',
+    'lldp',
+    'stp',
+    'traffic_segmentation',
+    'loopdetect',
+    'dhcp_local_relay'
+]
+
+schema = '''
+CREATE TABLE IF NOT EXISTS devices (
+    ip TEXT PRIMARY KEY,
+    eqp_type TEXT,
+    config_hash TEXT,
+    updated INTEGER
+);
+CREATE TABLE IF NOT EXISTS ports (
+    ip TEXT,
+    port INTEGER,
+    name TEXT,
+    port_type INTEGER,
+    PRIMARY KEY (ip, port)
+);
+CREATE TABLE IF NOT EXISTS options (
+    ip TEXT,
+    port INTEGER,
+    key TEXT,
+    option TEXT,
+    value TEXT
+);
+CREATE INDEX IF NOT EXISTS options_key ON options (key, option, value);
+CREATE INDEX IF NOT EXISTS options_ip ON options (ip, port);
+'''
+
+
+def _flatten(value, prefix=''):
+    if isinstance(value, dict):
+        for k, v in sorted(value.iteritems()):
+            for item in _flatten(v, '%s%s.' % (prefix, k)):
+                yield item
+    else:
+        yield prefix[:-1], value
+
+
+def rows(chassis, ports):
+    """
+    Функция получения строк индекса из разобранных опций оборудования.
+
+    :param chassis: объект класса Chassis
+    :param ports: объект класса Ports
+    :rtype: кортеж из массива описаний портов (port, name, port_type)
+            и массива опций (port, key, option, value)
+    """
+
+    port_rows = []
+    option_rows = []
+
+    objects = [(0, chassis)]
+    for port in ports:
+        port_rows.append((port['port'], port.name, port.port_type))
+        objects.append((port['port'], port))
+
+    for port_id, obj in objects:
+        for key in keys:
+            value = obj.__dict__.get(key)
+            if value is None:
+                continue
+
+            # набор портов traffic_segmentation
+            if not isinstance(value, dict):
+                value = {
+                    'forward_list': service.ports_tuple_2_ports_str(*value)
+                }
+
+            for option, v in _flatten(value):
+                option_rows.append((port_id, key, option, str(v)))
+
+    return port_rows, option_rows
+
+
+class Index(object):
+    """
+    Класс для работы с индексом опций оборудования.
+    """
+
+    def __init__(self, path):
+        """
+        Конструктор класса.
+
+        :param path: путь к файлу базы
+        """
+
+        self._lock = threading.Lock()
+
+        try:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.executescript(schema)
+        except sqlite3.Error as exc:
+            raise IndexException('%s: %s' % (path, exc))
+
+    def hashes(self):
+        """
+        Метод получения хэшей проиндексированных конфигураций.
+
+        :rtype: словарь {ip: config_hash}
+        """
+
+        with self._lock:
+            return dict(
+                self._db.execute('SELECT ip, config_hash FROM devices')
+            )
+
+    def update(self, ip, eqp_type, config_hash, port_rows, option_rows):
+        """
+        Метод замены записей оборудования в индексе.
+
+        :param ip: ip адрес оборудования
+        :param eqp_type: тип оборудования
+        :param config_hash: хэш конфигурационного файла и набора портов
+        :param port_rows: массив описаний портов, полученный функцией rows
+        :param option_rows: массив опций, полученный функцией rows
+        """
+
+        with self._lock:
+            try:
+                with self._db:
+                    for table in ['devices', 'ports', 'options']:
+                        self._db.execute(
+                            'DELETE FROM %s WHERE ip = ?' % table, (ip, )
+                        )
+                    self._db.execute(
+                        'INSERT INTO devices VALUES (?, ?, ?, ?)',
+                        (ip, eqp_type, config_hash, int(time.time()))
+                    )
+                    self._db.executemany(
+                        'INSERT INTO ports VALUES (?, ?, ?, ?)',
+                        ((ip, ) + tuple(row) for row in port_rows)
+                    )
+                    self._db.executemany(
+                        'INSERT INTO options VALUES (?, ?, ?, ?, ?)',
+                        ((ip, ) + tuple(row) for row in option_rows)
+                    )
+            except sqlite3.Error as exc:
+                raise IndexException('%s: %s' % (ip, exc))
+
+    def prune(self, keep):
+        """
+        Метод удаления записей оборудования, отсутствующего в наборе.
+
+        :param keep: множество ip адресов оборудования, записи которого
+                     остаются в индексе
+        :rtype: количество удаленного оборудования
+        """
+
+        with self._lock:
+            try:
+                with self._db:
+                    stale = [
+                        ip for (ip, ) in
+                        self._db.execute('SELECT ip FROM devices')
+                        if ip not in keep
+                    ]
+                    for ip in stale:
+                        for table in ['devices', 'ports', 'options']:
+                            self._db.execute(
+                                'DELETE FROM %s WHERE ip = ?' % table, (ip, )
+                            )
+            except sqlite3.Error as exc:
+                raise IndexException(exc)
+
+        return len(stale)
+
+    def query(self, sql, params=()):
+        """
+        Метод выполнения запроса к индексу.
+
+        :param sql: текст запроса
+        :param params: значения параметров запроса
+        :rtype: кортеж из массива имен столбцов и массива строк
+        """
+
+        with self._lock:
+            try:
+                cursor = self._db.execute(sql, params)
+                columns = [item[0] for item in cursor.description or []]
+                return columns, cursor.fetchall()
+            except sqlite3.Error as exc:
+                raise IndexException(exc)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class IndexException(Exception):
+    pass
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Журнал выполнения команды над оборудованием.
+
+Журнал - файл, в который дописывается по одной строке json на каждое
+обработанное оборудование:
+    {"ip": <ip адрес>, "command": <команда>, "status": <результат>,
+     "time": <время в секундах от начала эпохи>}
+
+Записи сбрасываются на диск (fsync) пачками, поэтому при аварийном
+завершении теряются не более последних sync_count записей или записей
+за последние sync_interval секунд, а оборванная последняя строка
+при чтении пропускается.
+"""
+
+
+import json
+import os
+import threading
+import time
+
+
+# результаты, при которых оборудование считается обработанным
+done_statuses = ['ok', 'skipped']
+
+
+def load_done(path, command):
+    """
+    Функция получения множества обработанного оборудования из журнала.
+
+    :param path: путь к файлу журнала
+    :param command: команда, записи других команд не учитываются
+    :rtype: множество ip адресов
+    """
+
+    result = set()
+
+    try:
+        _f = open(path, 'r')
+    except IOError:
+        return result
+
+    with _f:
+        for line in _f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # оборванная запись при аварийном завершении
+                continue
+            if record.get('command') == command and \
+                    record.get('status') in done_statuses:
+                result.add(record['ip'])
+
+    return result
+
+
+class Journal(object):
+    """
+    Класс журнала выполнения команды.
+    """
+
+    def __init__(self, path, command, sync_count=50, sync_interval=1):
+        """
+        Конструктор класса.
+
+        :param path: путь к файлу журнала
+        :param command: команда, выполняемая над оборудованием
+        :param sync_count: количество записей, после которого журнал
+                           сбрасывается на диск
+        :param sync_interval: время в секундах, после которого журнал
+                              сбрасывается на диск
+        """
+
+        self.command = command
+        self.sync_count = sync_count
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._synced = time.time()
+
+        try:
+            self._f = open(path, 'a+')
+            # после аварийного завершения последняя строка может быть
+            # оборвана, новые записи начинаются с новой строки
+            self._f.seek(0, os.SEEK_END)
+            if self._f.tell():
+                self._f.seek(-1, os.SEEK_END)
+                if self._f.read(1) != '\n':
+                    self._f.seek(0, os.SEEK_END)
+                    self._f.write('\n')
+        except IOError as exc:
+            raise JournalException(exc)
+
+    def write(self, record):
+        """
+        Метод добавления записи о результате обработки оборудования.
+
+        :param record: словарь результата с ключами ip и status
+        """
+
+        line = json.dumps({
+            'ip': record['ip'],
+            'command': self.command,
+            'status': record['status'],
+            'time': int(time.time())
+        })
+
+        with self._lock:
+            try:
+                self._f.write(line + '\n')
+                self._f.flush()
+                self._pending += 1
+                if self._pending >= self.sync_count or \
+                        time.time() - self._synced >= self.sync_interval:
+                    self._sync()
+            except EnvironmentError as exc:
+                raise JournalException(exc)
+
+    def _sync(self):
+        os.fsync(self._f.fileno())
+        self._pending = 0
+        self._synced = time.time()
+
+    def close(self):
+        """
+        Метод сброса оставшихся записей на диск и закрытия журнала.
+        """
+
+        with self._lock:
+            try:
+                if self._pending:
+                    self._sync()
+                self._f.close()
+            except EnvironmentError as exc:
+                raise JournalException(exc)
+
+
+class JournalException(Exception):
+    """
+    Базовое исключение.
+    """
+    pass
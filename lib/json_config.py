@@ -3,7 +3,58 @@
 
 import json
 import os
-import collections
+import threading
+
+
+# кэш настроек в пределах процесса
+# ключ - абсолютный путь к файлу настройки,
+# значение - кортеж ((mtime, size), настройки)
+_profiles = {}
+_profiles_lock = threading.Lock()
+
+
+class ReadOnlyDict(dict):
+    """
+    Словарь, доступный только для чтения.
+    Экземпляры разделяются между всеми потребителями кэша настроек,
+    поэтому любые попытки изменения запрещены. Обращение к отсутствующему
+    ключу возвращает пустой словарь (как у collections.defaultdict(dict)),
+    но не добавляет его.
+    """
+
+    def __missing__(self, key):
+        return ReadOnlyDict()
+
+    def __reduce__(self):
+        return ReadOnlyDict, (dict(self),)
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError('настройки доступны только для чтения')
+
+    __setitem__ = _readonly
+    __delitem__ = _readonly
+    clear = _readonly
+    pop = _readonly
+    popitem = _readonly
+    setdefault = _readonly
+    update = _readonly
+
+
+def freeze(obj):
+    """
+    Функция рекурсивного преобразования структуры данных
+    в структуру, доступную только для чтения.
+
+    :param obj: словарь, список или скалярное значение
+    :rtype: ReadOnlyDict, кортеж или скалярное значение
+    """
+
+    if isinstance(obj, dict):
+        return ReadOnlyDict((k, freeze(v)) for k, v in obj.iteritems())
+    elif isinstance(obj, list):
+        return tuple(freeze(i) for i in obj)
+    else:
+        return obj
 
 
 class Config(object):
@@ -22,6 +73,8 @@ class Config(object):
 
         self.path = path
         self.default = default_config
+        # соответствие типа оборудования пути к файлу настройки
+        self.eqp_files = {}
 
         try:
             self.c_config_files = os.listdir(path)
@@ -39,35 +92,61 @@ class Config(object):
         """
         Метод формирования структуры данных из файла настройки,
         указанного в пути.
+        Результат кэшируется в пределах процесса, файл перечитывается
+        только при изменении его времени модификации или размера.
 
         :param path: путь к файлу
-        :rtype: словарь с настройками
+        :rtype: словарь с настройками, доступный только для чтения
         """
 
+        path = os.path.abspath(path)
+
+        try:
+            stat = os.stat(path)
+        except EnvironmentError as exc:
+            raise ConfigException(exc)
+
+        version = (stat.st_mtime, stat.st_size)
+
+        with _profiles_lock:
+            cached = _profiles.get(path)
+
+        if cached and cached[0] == version:
+            return cached[1]
+
         try:
             with open(path, 'r') as _f:
                 config_str = _f.read().lower()
                 options = json.loads(config_str)
         except (IOError, ValueError) as exc:
             raise ConfigException(exc)
-        else:
-            return collections.defaultdict(dict, options)
+
+        options = freeze(options)
+
+        with _profiles_lock:
+            _profiles[path] = (version, options)
+
+        return options
 
     def load_options(self, eqp_type=None):
         """
         Метод формирования структуры данных из файла настройки.
 
         :param eqp_type: строка типа оборудования
-        :rtype: словарь с настройками
+        :rtype: словарь с настройками, доступный только для чтения
         """
 
-        c_file_name = self.default
-        if eqp_type:
-            eqp_json = eqp_type.lower() + '.json'
-            if eqp_json in self.c_config_files:
-                c_file_name = eqp_json
-
-        c_file_path = os.path.join(self.path, c_file_name)
+        try:
+            c_file_path = self.eqp_files[eqp_type]
+        except KeyError:
+            c_file_name = self.default
+            if eqp_type:
+                eqp_json = eqp_type.lower() + '.json'
+                if eqp_json in self.c_config_files:
+                    c_file_name = eqp_json
+
+            c_file_path = os.path.join(self.path, c_file_name)
+            self.eqp_files[eqp_type] = c_file_path
 
         return self.get_options(c_file_path)
 
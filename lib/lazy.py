@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Отложенный импорт модулей.
+
+Модуль импортируется при первом обращении к его атрибуту, поэтому
+зависимости, нужные только части команд (ssh, разбор конфигурационных
+файлов, snmp), не загружаются при запуске остальных команд.
+"""
+
+
+import importlib
+
+
+class LazyModule(object):
+    """
+    Класс модуля с отложенным импортом.
+    """
+
+    def __init__(self, name):
+        """
+        Конструктор класса.
+
+        :param name: полное имя модуля
+        """
+
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        if self._module is None:
+            self.__dict__['_module'] = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
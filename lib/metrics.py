@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Измерение длительности этапов работы с оборудованием.
+
+Длительности этапов (ping, snmp запросы, ожидание передачи
+конфигурационного файла, ssh подключение, парсинг, формирование команд,
+авторизация по telnet, выполнение команд и файла сценария, сохранение
+конфигурации) собираются в гистограммы и счетчики ошибок за время
+запуска и записываются в textfile формата Prometheus и в сводку json.
+Пока сбор не включен функцией enable, измерение сводится к проверке
+глобальной переменной.
+"""
+
+
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+
+# верхние границы корзин гистограмм в секундах
+buckets = [0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+# текущий набор гистограмм, None - сбор выключен
+_registry = None
+
+
+class Registry(object):
+    """
+    Класс набора гистограмм длительностей этапов.
+    """
+
+    def __init__(self, buckets=buckets):
+        """
+        Конструктор класса.
+
+        :param buckets: возрастающие верхние границы корзин в секундах
+        """
+
+        self.buckets = list(buckets)
+        self.started = time.time()
+        self._phases = {}
+        self._lock = threading.Lock()
+
+    def observe(self, phase, seconds, ok=True):
+        """
+        Метод учета длительности этапа.
+
+        :param phase: название этапа
+        :param seconds: длительность в секундах
+        :param ok: этап завершился успешно
+        """
+
+        with self._lock:
+            stat = self._phases.get(phase)
+            if stat is None:
+                stat = self._phases[phase] = {
+                    'count': 0,
+                    'errors': 0,
+                    'sum': 0.0,
+                    'min': seconds,
+                    'max': seconds,
+                    'buckets': [0] * len(self.buckets)
+                }
+
+            stat['count'] += 1
+            stat['sum'] += seconds
+            stat['min'] = min(stat['min'], seconds)
+            stat['max'] = max(stat['max'], seconds)
+            if not ok:
+                stat['errors'] += 1
+
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    stat['buckets'][i] += 1
+                    break
+
+    def summary(self):
+        """
+        Метод получения сводки по этапам.
+
+        :rtype: словарь {этап: {count, errors, sum, min, max, mean,
+                buckets: {граница: количество, не накопительно}}}
+        """
+
+        with self._lock:
+            result = {}
+            for phase, stat in self._phases.iteritems():
+                result[phase] = {
+                    'count': stat['count'],
+                    'errors': stat['errors'],
+                    'sum': round(stat['sum'], 3),
+                    'min': round(stat['min'], 3),
+                    'max': round(stat['max'], 3),
+                    'mean': round(stat['sum'] / stat['count'], 3),
+                    'buckets': dict(
+                        (str(bound), count) for bound, count in
+                        zip(self.buckets, stat['buckets']) if count
+                    )
+                }
+            return result
+
+    def textfile(self):
+        """
+        Метод получения гистограмм в текстовом формате Prometheus.
+
+        :rtype: строка
+        """
+
+        lines = [
+            '# HELP dlink_phase_duration_seconds Duration of equipment '
+            'processing phases.',
+            '# TYPE dlink_phase_duration_seconds histogram'
+        ]
+        errors = [
+            '# HELP dlink_phase_errors_total Number of failed equipment '
+            'processing phases.',
+            '# TYPE dlink_phase_errors_total counter'
+        ]
+
+        with self._lock:
+            for phase in sorted(self._phases):
+                stat = self._phases[phase]
+                total = 0
+                for bound, count in zip(self.buckets, stat['buckets']):
+                    total += count
+                    lines.append(
+                        'dlink_phase_duration_seconds_bucket'
+                        '{phase="%s",le="%s"} %s' % (phase, bound, total)
+                    )
+                lines.append(
+                    'dlink_phase_duration_seconds_bucket'
+                    '{phase="%s",le="+Inf"} %s' % (phase, stat['count'])
+                )
+                lines.append(
+                    'dlink_phase_duration_seconds_sum{phase="%s"} %.6f' %
+                    (phase, stat['sum'])
+                )
+                lines.append(
+                    'dlink_phase_duration_seconds_count{phase="%s"} %s' %
+                    (phase, stat['count'])
+                )
+                errors.append(
+                    'dlink_phase_errors_total{phase="%s"} %s' %
+                    (phase, stat['errors'])
+                )
+
+        lines += errors + [
+            '# HELP dlink_run_timestamp_seconds Start time of the run.',
+            '# TYPE dlink_run_timestamp_seconds gauge',
+            'dlink_run_timestamp_seconds %d' % self.started
+        ]
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """
+        Метод записи textfile Prometheus и сводки json рядом с ним
+        (<path без расширения>.json). Файлы записываются через
+        временный файл, чтобы сборщик не прочитал файл частично.
+
+        :param path: путь к textfile, для textfile collector
+                     node_exporter - с расширением .prom
+        """
+
+        json_path = os.path.splitext(path)[0] + '.json'
+
+        try:
+            for file_path, content in [
+                    (path, self.textfile()),
+                    (json_path, json.dumps(self.summary(), sort_keys=True,
+                                           indent=2) + '\n')]:
+                with open(file_path + '.tmp', 'w') as _f:
+                    _f.write(content)
+                os.rename(file_path + '.tmp', file_path)
+        except (IOError, OSError) as exc:
+            raise MetricsException(exc)
+
+
+def enable(registry):
+    """
+    Функция включения сбора длительностей этапов.
+
+    :param registry: объект класса Registry
+    """
+
+    global _registry
+    _registry = registry
+
+
+def disable():
+    """
+    Функция выключения сбора длительностей этапов.
+    """
+
+    global _registry
+    _registry = None
+
+
+def observe(phase, seconds, ok=True):
+    """
+    Функция учета длительности этапа, если сбор включен.
+    """
+
+    registry = _registry
+    if registry is not None:
+        registry.observe(phase, seconds, ok)
+
+
+def timed(phase):
+    """
+    Декоратор измерения длительности вызова функции, этап считается
+    неуспешным, если функция завершилась исключением.
+
+    :param phase: название этапа
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            registry = _registry
+            if registry is None:
+                return func(*args, **kwargs)
+
+            start = time.time()
+            ok = False
+            try:
+                result = func(*args, **kwargs)
+                ok = True
+                return result
+            finally:
+                registry.observe(phase, time.time() - start, ok)
+        return wrapper
+    return decorator
+
+
+@contextlib.contextmanager
+def measure(phase):
+    """
+    Контекстный менеджер измерения длительности блока кода, этап
+    считается неуспешным, если блок завершился исключением.
+
+    :param phase: название этапа
+    """
+
+    registry = _registry
+    if registry is None:
+        yield
+        return
+
+    start = time.time()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        registry.observe(phase, time.time() - start, ok)
+
+
+class MetricsException(Exception):
+    pass
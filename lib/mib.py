@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Соответствие опций настройки оборудования объектам стандартных mib
+и mib d-link. Значения опций приводятся к тому же виду, в котором они
+встречаются в конфигурационном файле оборудования.
+"""
+
+
+# значения типа TruthValue и большинства параметров состояния d-link mib
+truth_value = {
+    'enable': 1,
+    'disable': 2
+}
+
+# Q-BRIDGE-MIB, таблица dot1qVlanStaticTable, индекс - номер vlan
+vlan_static_name = '1.3.6.1.2.1.17.7.1.4.3.1.1'
+vlan_static_egress_ports = '1.3.6.1.2.1.17.7.1.4.3.1.2'
+vlan_static_untagged_ports = '1.3.6.1.2.1.17.7.1.4.3.1.4'
+
+# BRIDGE-MIB, dot1dStpPriority, приоритет stp (instance_id 0)
+stp_priority = '1.3.6.1.2.1.17.2.2.0'
+
+# опции портов
+# (ключ, опция): (oid столбца таблицы с индексом по номеру порта,
+#                 соответствие значений опции значениям mib)
+# если соответствие не указано, значение опции - целое число
+port_options = {
+    # LLDP-MIB, lldpPortConfigAdminStatus
+    ('lldp', 'admin_status'): (
+        '1.0.8802.1.1.2.1.1.6.1.2',
+        {'tx_only': 1, 'rx_only': 2, 'tx_and_rx': 3, 'disable': 4}
+    ),
+    # LLDP-MIB, lldpPortConfigNotificationEnable
+    ('lldp', 'notification'): ('1.0.8802.1.1.2.1.1.6.1.3', truth_value),
+    # BRIDGE-MIB, dot1dStpPortEnable
+    ('stp', 'state'): ('1.3.6.1.2.1.17.2.15.1.4', truth_value),
+    # LOOPBACK-DETECT-MIB, swL2LoopDetectPortState
+    ('loopdetect', 'state'): ('1.3.6.1.4.1.171.12.41.3.1.1.2', truth_value)
+}
+
+# глобальные опции
+# (ключ, опция): (oid скалярного объекта,
+#                 соответствие значений опции значениям mib)
+chassis_options = {
+    # LLDP-EXT-DLINK-MIB, swLLDPStateAdmin
+    ('lldp', 'state'): ('1.3.6.1.4.1.171.12.32.1.1.0', truth_value),
+    # MSTP-MIB, swMSTPStpAdminState
+    ('stp', 'state'): ('1.3.6.1.4.1.171.12.15.1.1.0', truth_value),
+    # LOOPBACK-DETECT-MIB
+    ('loopdetect', 'state'): ('1.3.6.1.4.1.171.12.41.1.1.0', truth_value),
+    ('loopdetect', 'interval'): ('1.3.6.1.4.1.171.12.41.1.2.0', None),
+    ('loopdetect', 'recover_timer'): ('1.3.6.1.4.1.171.12.41.1.3.0', None),
+    ('loopdetect', 'mode'): (
+        '1.3.6.1.4.1.171.12.41.1.4.0',
+        {'port-based': 1, 'vlan-based': 2}
+    )
+}
+
+
+def value_2_option(value, values=None):
+    """
+    Функция преобразования значения объекта mib в значение опции.
+
+    :param value: значение объекта mib
+    :param values: соответствие значений опции значениям mib
+    :rtype: строка
+    """
+
+    value = int(value)
+
+    if values is None:
+        return str(value)
+
+    for option, _value in values.iteritems():
+        if _value == value:
+            return option
+
+    raise ValueError('неизвестное значение объекта mib - %s' % value)
+
+
+def option_2_value(option, values=None):
+    """
+    Функция преобразования значения опции в значение объекта mib.
+
+    :param option: значение опции
+    :param values: соответствие значений опции значениям mib
+    :rtype: целое число
+    """
+
+    if values is None:
+        return int(option)
+
+    try:
+        return values[option]
+    except KeyError:
+        raise ValueError('неизвестное значение опции - %s' % option)
@@ -16,6 +16,7 @@ raw sockets, что требовало выполнение сценариев 
 import re
 import subprocess
 
+import metrics
 import service
 
 
@@ -34,13 +35,16 @@ class Response(object):
         self.output = ''
         self.destination = ''
         self.destination_ip = ''
+        # наибольшее время ответа в секундах
+        self.rtt = None
 
 
 class PingException(service.BasicException):
     pass
 
 
-def ping(target, count=3):
+@metrics.timed('ping')
+def ping(target, count=3, timeout=None):
     """
     Функция в которой вызывается системная утилита ping и с помощью
     регулярных выражений из вывода извлекаются нужные параметры.
@@ -50,12 +54,16 @@ def ping(target, count=3):
 
     :param target: ip адрес целевого оборудования
     :param count: количество icmp запросов, значение по умолчанию - 3
+    :param timeout: время ожидания каждого ответа в секундах, если не
+                    указано - используется значение утилиты по умолчанию
     :rtype: экземпляр класса Response
     """
 
-    proc = subprocess.Popen(
-        [ping_path, '-c', str(count), target], stdout=subprocess.PIPE
-    )
+    cmd = [ping_path, '-c', str(count)]
+    if timeout:
+        cmd += ['-W', str(timeout)]
+
+    proc = subprocess.Popen(cmd + [target], stdout=subprocess.PIPE)
     # тут используется метод communicate для ожидания окончания
     # выполнения утилиты
     stdout, stderr = proc.communicate()
@@ -68,6 +76,7 @@ def ping(target, count=3):
     re_dest = r'([\w.]+)'
     re_dest_ip = r'\(([\d.]+)\)'
     re_loss = r'(\d+)%\s+packet\s+loss'
+    re_rtt = r'=\s*[\d.]+/[\d.]+/([\d.]+)/[\d.]+\s*ms'
 
     re_str = r'PING' + re_space + re_dest + re_space + re_dest_ip + \
         re_other + re_space + re_loss
@@ -78,6 +87,9 @@ def ping(target, count=3):
             match.groups()
         if int(resp.packet_lost) < 65:
             resp.ret_code = 0
+            match = re.search(re_rtt, stdout)
+            if match:
+                resp.rtt = float(match.group(1)) / 1000
         else:
             raise PingException(
                 target, 'оборудование недоступно'
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+
+
+import itertools
+import Queue
+import signal
+import sys
+import threading
+import time
+
+import lazy
+
+
+# пул процессов нужен только командам audit и index
+multiprocessing = lazy.LazyModule('multiprocessing')
+
+# признак окончания работы потока
+_STOP = object()
+
+
+def imap_unordered(func, iterable, workers=1):
+    """
+    Генератор результатов выполнения функции над элементами итератора
+    в пуле потоков. Элементы забираются из итератора по мере освобождения
+    потоков через очередь ограниченного размера, поэтому итератор не
+    раскрывается целиком. Результаты возвращаются по мере готовности.
+    Исключение, возникшее в функции или итераторе, возбуждается повторно
+    в вызывающем потоке. Если генератор закрыт до окончания обработки,
+    оставшиеся элементы не обрабатываются и потоки завершаются.
+
+    :param func: функция одного аргумента
+    :param iterable: итератор аргументов
+    :param workers: количество потоков
+    :rtype: итератор результатов
+    """
+
+    if workers <= 1:
+        for item in iterable:
+            yield func(item)
+        return
+
+    tasks = Queue.Queue(workers * 2)
+    results = Queue.Queue()
+    stopped = threading.Event()
+
+    def feeder():
+        try:
+            for item in iterable:
+                if stopped.is_set():
+                    break
+                tasks.put(item)
+        except Exception:
+            results.put((False, sys.exc_info()))
+        finally:
+            for _c in xrange(workers):
+                tasks.put(_STOP)
+
+    def worker():
+        while 1:
+            item = tasks.get()
+            if item is _STOP:
+                results.put(_STOP)
+                return
+            if stopped.is_set():
+                continue
+            try:
+                results.put((True, func(item)))
+            except Exception:
+                results.put((False, sys.exc_info()))
+
+    threads = [threading.Thread(target=feeder)] + [
+        threading.Thread(target=worker) for _c in xrange(workers)
+    ]
+    for thread in threads:
+        # потоки не должны препятствовать завершению процесса,
+        # например при прерывании по Ctrl-C
+        thread.daemon = True
+        thread.start()
+
+    running = workers
+    try:
+        while running:
+            # ожидание с таймаутом, иначе в python 2 главный поток
+            # не получает KeyboardInterrupt
+            try:
+                result = results.get(True, 0.5)
+            except Queue.Empty:
+                continue
+
+            if result is _STOP:
+                running -= 1
+                continue
+
+            success, value = result
+            if success:
+                yield value
+            else:
+                raise value[0], value[1], value[2]
+    finally:
+        stopped.set()
+
+
+def waves(iterable, sizes):
+    """
+    Генератор волн - массивов элементов итератора возрастающего размера,
+    после волн заданных размеров все оставшиеся элементы образуют
+    последнюю волну. Итератор раскрывается по мере получения волн,
+    последняя волна - итератор, раскрываемый по мере обработки, поэтому
+    большой набор адресов не загружается в память целиком.
+
+    :param iterable: итератор элементов
+    :param sizes: размеры волн, например [1, 10, 100]
+    :rtype: итератор волн
+    """
+
+    iterator = iter(iterable)
+
+    for size in sizes:
+        wave = list(itertools.islice(iterator, size))
+        if not wave:
+            return
+        yield wave
+
+    for first in iterator:
+        yield itertools.chain([first], iterator)
+        return
+
+
+def _process_init(initializer, initargs):
+    # прерывание по Ctrl-C обрабатывается только родительским процессом
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if initializer:
+        initializer(*initargs)
+
+
+def process_imap_unordered(func, items, workers=1, initializer=None,
+                           initargs=()):
+    """
+    Генератор результатов выполнения функции над элементами массива
+    в пуле процессов, для задач, ограниченных процессором. Элементы
+    передаются процессам пачками, чтобы затраты на передачу данных
+    между процессами не превышали выигрыш от распараллеливания, поэтому
+    функция и ее результаты должны быть компактными и сериализуемыми.
+
+    :param func: функция одного аргумента уровня модуля
+    :param items: массив аргументов
+    :param workers: количество процессов
+    :param initializer: функция, вызываемая в каждом процессе при запуске
+    :param initargs: аргументы функции initializer
+    :rtype: итератор результатов
+    """
+
+    if workers <= 1:
+        if initializer:
+            initializer(*initargs)
+        for item in items:
+            yield func(item)
+        return
+
+    # по несколько пачек на процесс, чтобы процессы, получившие
+    # более тяжелые элементы, не задерживали завершение
+    chunksize = max(1, len(items) // (workers * 4))
+
+    process_pool = multiprocessing.Pool(
+        workers, _process_init, (initializer, initargs)
+    )
+    try:
+        results = process_pool.imap_unordered(func, items, chunksize)
+        while 1:
+            # ожидание с таймаутом, иначе в python 2 главный процесс
+            # не получает KeyboardInterrupt
+            try:
+                yield results.next(0.5)
+            except multiprocessing.TimeoutError:
+                continue
+            except StopIteration:
+                break
+        process_pool.close()
+    finally:
+        process_pool.terminate()
+        process_pool.join()
+
+
+class Background(object):
+    """
+    Класс выполнения функции в отдельном потоке, результат которой
+    понадобится позже или не понадобится вовсе.
+    """
+
+    def __init__(self, func, *args, **kwargs):
+        """
+        Конструктор класса, запускающий поток.
+
+        :param func: функция
+        :param args: позиционные аргументы функции
+        :param kwargs: именованные аргументы функции
+        """
+
+        self._lock = threading.Lock()
+        self._result = None
+        self._exc_info = None
+        self._cleanup = None
+
+        def run():
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                with self._lock:
+                    self._exc_info = sys.exc_info()
+                return
+            with self._lock:
+                self._result = result
+                cleanup = self._cleanup
+            if cleanup:
+                cleanup(result)
+
+        self._thread = threading.Thread(target=run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def result(self):
+        """
+        Метод ожидания и получения результата функции. Исключение,
+        возникшее в функции, возбуждается повторно в вызывающем потоке.
+
+        :rtype: результат функции
+        """
+
+        self._thread.join()
+        if self._exc_info:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def discard(self, cleanup):
+        """
+        Метод отказа от результата без ожидания завершения функции.
+
+        :param cleanup: функция одного аргумента, освобождающая результат,
+                        вызывается сразу или по завершении функции
+        """
+
+        with self._lock:
+            self._cleanup = cleanup
+            result = self._result
+        if result is not None:
+            cleanup(result)
+
+
+class RateLimiter(object):
+    """
+    Класс ограничения частоты операций для нескольких потоков.
+    """
+
+    def __init__(self, rate):
+        """
+        Конструктор класса.
+
+        :param rate: максимальное количество операций в секунду,
+                     0 - без ограничения
+        """
+
+        self.interval = 1.0 / rate if rate else 0
+        self._next = time.time()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """
+        Метод ожидания разрешения на выполнение очередной операции.
+        """
+
+        if not self.interval:
+            return
+
+        with self._lock:
+            now = time.time()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+
+        if delay > 0:
+            time.sleep(delay)
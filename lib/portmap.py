@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Хранение набора портов оборудования рядом с сохраненными
+конфигурационными файлами. Вместе с конфигурационным файлом набор портов
+позволяет формировать команды настройки оборудования без обращения
+к нему.
+"""
+
+
+import json
+
+
+suffix = '.ports'
+
+
+def load(path):
+    """
+    Функция чтения набора портов, сохраненного для конфигурационного файла.
+
+    :param path: путь к конфигурационному файлу
+    :rtype: массив описаний портов или None
+    """
+
+    try:
+        with open(path + suffix, 'r') as _f:
+            return json.load(_f)
+    except (IOError, ValueError):
+        return None
+
+
+def dump(path, ports):
+    """
+    Функция сохранения набора портов для конфигурационного файла.
+
+    :param path: путь к конфигурационному файлу
+    :param ports: массив описаний портов
+    """
+
+    with open(path + suffix, 'w') as _f:
+        json.dump(ports, _f)
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Распределение передач файлов по TFTP серверам и ограничение количества
+одновременных передач.
+
+Сервер для передачи выбирается по наименьшему количеству ожидающих и
+выполняющихся через него передач, при распределении по площадкам
+в первую очередь рассматриваются серверы площадки оборудования.
+
+Оборудование допускается к передаче файла только при наличии свободного
+места во всех ограничениях сразу:
+    - общем количестве передач
+    - количестве передач через один TFTP сервер
+    - количестве передач в пределах площадки, площадка определяется
+      по таблице соответствия диапазонов адресов имени площадки, а для
+      адресов вне таблицы - сетью /24 адреса оборудования
+
+Остальные этапы работы с оборудованием ограничениями не затрагиваются.
+"""
+
+
+import collections
+import contextlib
+import threading
+
+import targets
+
+
+class Scheduler(object):
+    """
+    Класс распределения и ограничения одновременных передач файлов.
+    """
+
+    def __init__(self,
+                 servers,
+                 balance='least',
+                 limit=0,
+                 server_limit=0,
+                 site_limit=0,
+                 sites=None):
+        """
+        Конструктор класса.
+
+        :param servers: массив словарей параметров TFTP серверов с ключами
+                        как у параметров конструктора Dlink (tftp_server,
+                        config_load_method, tftp_path, username, password)
+                        и необязательным ключом sites - массивом имен
+                        площадок, закрепленных за сервером
+        :param balance: метод распределения оборудования по серверам:
+                        least - по наименьшему количеству передач
+                        site - в первую очередь серверы площадки
+                        оборудования, затем по наименьшему количеству
+                        передач
+        :param limit: общее количество одновременных передач,
+                      0 - без ограничения
+        :param server_limit: количество одновременных передач через
+                             один TFTP сервер, 0 - без ограничения
+        :param site_limit: количество одновременных передач в пределах
+                           одной площадки, 0 - без ограничения
+        :param sites: словарь соответствия записи адресов (в любом виде,
+                      допустимом для targets) имени площадки
+        """
+
+        if balance not in ['least', 'site']:
+            raise SchedulerException(
+                'неверный метод распределения - %s' % balance
+            )
+
+        self.servers = list(servers)
+        self.balance = balance
+        self.server_limit = server_limit
+        self.site_limit = site_limit
+
+        self._global = threading.BoundedSemaphore(limit) if limit else None
+        self._servers = {}
+        self._sites = {}
+        self._lock = threading.Lock()
+
+        # диапазоны площадок упорядочены по размеру, чтобы более
+        # узкий диапазон имел приоритет над охватывающим его
+        self._site_ranges = sorted(
+            (
+                targets.spec_parse(spec) + (name, )
+                for spec, name in (sites or {}).iteritems()
+            ),
+            key=lambda item: item[1] - item[0]
+        )
+
+        # количество ожидающих и выполняющихся передач по серверам
+        self.outstanding = collections.defaultdict(int)
+
+    def get_site(self, ip):
+        """
+        Метод определения площадки оборудования.
+
+        :param ip: ip адрес оборудования
+        :rtype: строка с именем площадки или сетью /24 адреса
+        """
+
+        address = targets.ip_2_int(ip)
+
+        for begin, end, name in self._site_ranges:
+            if begin <= address <= end:
+                return name
+
+        return targets.int_2_ip(address & 0xffffff00) + '/24'
+
+    def _semaphore(self, semaphores, key, limit):
+        with self._lock:
+            if key not in semaphores:
+                semaphores[key] = threading.BoundedSemaphore(limit)
+            return semaphores[key]
+
+    def _choose(self, ip, exclude):
+        """
+        Метод выбора сервера для передачи, вызывается под блокировкой.
+
+        :param ip: ip адрес оборудования
+        :param exclude: массив адресов серверов, которые не выбираются
+        :rtype: словарь параметров сервера
+        """
+
+        site = self.get_site(ip) if self.balance == 'site' else None
+
+        candidates = [
+            (site not in server.get('sites', ()),
+             self.outstanding[server['tftp_server']],
+             index)
+            for index, server in enumerate(self.servers)
+            if server['tftp_server'] not in exclude
+        ]
+
+        if not candidates:
+            raise SchedulerException(
+                '%s - нет доступных TFTP серверов' % ip
+            )
+
+        return self.servers[min(candidates)[2]]
+
+    @contextlib.contextmanager
+    def slot(self, ip, exclude=()):
+        """
+        Контекстный менеджер передачи файла, выбирает сервер, ожидает
+        свободного места во всех ограничениях и освобождает его по
+        завершении передачи.
+        Ограничения занимаются всегда в одном порядке - площадка,
+        сервер, общее, поэтому взаимная блокировка невозможна, а общее
+        ограничение не занимается на время ожидания остальных.
+
+        :param ip: ip адрес оборудования
+        :param exclude: массив адресов серверов, которые не выбираются,
+                        например уже не справившихся с передачей
+        :rtype: словарь параметров выбранного сервера
+        """
+
+        with self._lock:
+            server = self._choose(ip, exclude)
+            address = server['tftp_server']
+            self.outstanding[address] += 1
+
+        semaphores = []
+        if self.site_limit:
+            semaphores.append(self._semaphore(
+                self._sites, self.get_site(ip), self.site_limit
+            ))
+        if self.server_limit:
+            semaphores.append(self._semaphore(
+                self._servers, address, self.server_limit
+            ))
+        if self._global:
+            semaphores.append(self._global)
+
+        acquired = []
+        try:
+            for semaphore in semaphores:
+                semaphore.acquire()
+                acquired.append(semaphore)
+            yield server
+        finally:
+            for semaphore in reversed(acquired):
+                semaphore.release()
+            with self._lock:
+                self.outstanding[address] -= 1
+
+
+class SchedulerException(Exception):
+    """
+    Базовое исключение.
+    """
+    pass
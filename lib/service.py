@@ -4,7 +4,10 @@
 import re
 import collections
 
-import dictdiffer
+import lazy
+
+
+dictdiffer = lazy.LazyModule('dictdiffer')
 
 
 class Base(object):
@@ -542,6 +545,45 @@ def ports_any_2_ports_int(arg):
     return result
 
 
+def ports_bitmap_2_ports_int(arg):
+    """
+    Функция преобразования битовой маски портов (PortList из Q-BRIDGE-MIB)
+    в массив целых чисел. Старший бит первого байта соответствует порту 1.
+
+        >>> ports_bitmap_2_ports_int('\\xc0\\x01')
+        [1, 2, 16]
+
+    :param arg: строка байт
+    :rtype: массив целых чисел
+    """
+    result = []
+
+    for index, byte in enumerate(bytearray(arg)):
+        for bit in xrange(8):
+            if byte & (0x80 >> bit):
+                result.append(index * 8 + bit + 1)
+
+    return result
+
+
+def plain(obj):
+    """
+    Функция преобразования наследников словаря (например настроек,
+    доступных только для чтения) и кортежей в обычные словари и массивы,
+    dictdiffer сравнивает только объекты одного и того же типа.
+
+    :param obj: словарь, массив, кортеж или скалярное значение
+    :rtype: словарь, массив или скалярное значение
+    """
+
+    if isinstance(obj, dict):
+        return dict((k, plain(v)) for k, v in obj.iteritems())
+    elif isinstance(obj, (list, tuple)):
+        return [plain(i) for i in obj]
+    else:
+        return obj
+
+
 def dict_substract(minuend, subtrahend):
     """
     Функция вычитания одного словаря из другого.
@@ -559,7 +601,7 @@ def dict_substract(minuend, subtrahend):
 
     diff = (
         i for i in
-        dictdiffer.diff(subtrahend, minuend)
+        dictdiffer.diff(subtrahend, plain(minuend))
         if i[0] in ['add', 'change', 'push']
     )
 
@@ -1,18 +1,67 @@
 # -*- coding: utf-8 -*-
 
 
-from pysnmp.entity.rfc3413.oneliner import cmdgen
-from pysnmp.proto.rfc1905 import NoSuchInstance
+import collections
+import contextlib
+import threading
+import time
 
+import lazy
+import metrics
 import service
 
 
+cmdgen = lazy.LazyModule('pysnmp.entity.rfc3413.oneliner.cmdgen')
+rfc1905 = lazy.LazyModule('pysnmp.proto.rfc1905')
+
+
+# свободные генераторы команд, создание генератора (snmp engine) дорого,
+# поэтому генераторы используются повторно всеми экземплярами Snmp,
+# каждый генератор одновременно используется только одним потоком.
+# Генератор запоминает параметры оборудования по адресу без таймаута и
+# количества повторов, поэтому генераторы разделяются по этим значениям
+_generators = collections.defaultdict(list)
+_generators_lock = threading.Lock()
+
+# количество адресов оборудования, после обращения к которым генератор
+# не возвращается в пул, генератор не удаляет запомненные адреса, и без
+# ограничения их количество растет все время работы сервиса или обхода
+# большой сети
+max_addresses = 256
+
+
+@contextlib.contextmanager
+def _generator(key, ip):
+    """
+    Контекстный менеджер получения свободного генератора команд.
+
+    :param key: кортеж из таймаута и количества повторных запросов
+    :param ip: ip адрес оборудования, к которому выполняется запрос
+    """
+
+    with _generators_lock:
+        entry = _generators[key].pop() if _generators[key] else None
+
+    if entry is None:
+        entry = (cmdgen.CommandGenerator(), set())
+
+    cmd_gen, addresses = entry
+    addresses.add(ip)
+
+    try:
+        yield cmd_gen
+    finally:
+        if len(addresses) < max_addresses:
+            with _generators_lock:
+                _generators[key].append(entry)
+
+
 class Snmp(object):
     """
     Класс для работы с оборудование по snmp.
     """
 
-    def __init__(self, ip, community_read, community_write, timeout=1):
+    def __init__(self, ip, community_read, community_write, timeout=1, retries=5):
         """
         Конструктор класса.
         В нем инициализирутся генератор команд для pysnmp и
@@ -22,36 +71,46 @@ class Snmp(object):
         :param community_read: имя community для чтения параметров по протоколу snmp
         :param community_write: имя community для записи параметров по протоколу snmp
         :param timeout: время ожидания ответа от оборудования
+        :param retries: количество повторных запросов при отсутствии ответа
         """
 
         self.ip = ip
-        self.cmdGen = cmdgen.CommandGenerator()
         self.community_read = cmdgen.CommunityData(community_read)
         self.community_write = cmdgen.CommunityData(community_write)
         # объект для работы с обрудованием по snmp
         # в конструктор передается именно кортеж
-        self.target = cmdgen.UdpTransportTarget((ip, 161), timeout=timeout)
+        self.target = cmdgen.UdpTransportTarget(
+            (ip, 161), timeout=timeout, retries=retries
+        )
+        # ключ пула генераторов команд
+        self._generator_key = (timeout, retries)
+        # наибольшее время выполнения успешного get запроса в секундах
+        self.latency = None
 
-    def get(self, oid):
+    @metrics.timed('snmp_get')
+    def get(self, *oids):
         """
         Метод, реализующий get snmp запрос.
 
-        :param oid: строка необходимого oid'а в цифровом виде
-        :rtype: массив с одним кортежем, состоящим из объекта oid и
-                объекта значения
+        :param oids: перечень строк необходимых oid'ов в цифровом виде
+        :rtype: массив кортежей (по одному на каждый oid), состоящих
+                из объекта oid и объекта значения
         """
 
-        errorIndication, errorStatus, errorIndex, varBinds = \
-            self.cmdGen.getCmd(
-                self.community_read,
-                self.target,
-                oid
-            )
+        start = time.time()
+        with _generator(self._generator_key, self.ip) as cmd_gen:
+            errorIndication, errorStatus, errorIndex, varBinds = \
+                cmd_gen.getCmd(
+                    self.community_read,
+                    self.target,
+                    *oids
+                )
         if errorIndication:
             raise SnmpGetTimeoutException(
                 self.ip, errorIndication
             )
         else:
+            self.latency = max(self.latency, time.time() - start)
             if errorStatus:
                 raise SnmpOtherException(
                     self.ip, '%s at %s' %
@@ -59,13 +118,14 @@ class Snmp(object):
                      errorIndex and varBinds[int(errorIndex) - 1] or '?')
                 )
             else:
-                if varBinds[0][1] == NoSuchInstance():
-                    raise SnmpOtherException(
-                        self.ip, 'указан неверный oid - %s' % oid
-                    )
-                else:
-                    return varBinds
+                for oid, value in varBinds:
+                    if value == rfc1905.NoSuchInstance():
+                        raise SnmpOtherException(
+                            self.ip, 'указан неверный oid - %s' % oid
+                        )
+                return varBinds
 
+    @metrics.timed('snmp_set')
     def set(self, *oids):
         """
         Метод, реализующий set snmp запрос.
@@ -75,12 +135,13 @@ class Snmp(object):
           ('1.3.6.1.4.1.171.12.1.2.1.1.6.3', pysnmp.proto.rfc1902.Integer(3))
         """
 
-        errorIndication, errorStatus, errorIndex, varBinds = \
-            self.cmdGen.setCmd(
-                self.community_write,
-                self.target,
-                *oids
-            )
+        with _generator(self._generator_key, self.ip) as cmd_gen:
+            errorIndication, errorStatus, errorIndex, varBinds = \
+                cmd_gen.setCmd(
+                    self.community_write,
+                    self.target,
+                    *oids
+                )
         if errorIndication:
             raise SnmpSetTimeoutException(
                 self.ip, errorIndication
@@ -95,6 +156,7 @@ class Snmp(object):
             else:
                 pass
 
+    @metrics.timed('snmp_walk')
     def next(self, *oids):
         """
         Метод, реализующий next snmp запрос.
@@ -104,12 +166,13 @@ class Snmp(object):
                 свою очередь состоит из объекта oid и объекта значения
         """
 
-        errorIndication, errorStatus, errorIndex, varBinds = \
-            self.cmdGen.nextCmd(
-                self.community_read,
-                self.target,
-                *oids
-            )
+        with _generator(self._generator_key, self.ip) as cmd_gen:
+            errorIndication, errorStatus, errorIndex, varBinds = \
+                cmd_gen.nextCmd(
+                    self.community_read,
+                    self.target,
+                    *oids
+                )
         if errorIndication:
             raise SnmpGetTimeoutException(
                 self.ip, errorIndication
@@ -129,6 +192,49 @@ class Snmp(object):
                         self.ip, 'указан неверный oid - %s' % oids
                     )
 
+    @metrics.timed('snmp_bulk')
+    def bulk(self, *oids, **kwargs):
+        """
+        Метод, реализующий getbulk snmp запрос для обхода таблиц
+        за меньшее количество запросов, чем метод next.
+
+        :param oids: перечень строк необходимых oid'ов в цифровом виде
+        :param max_repetitions: количество строк таблицы, запрашиваемых
+                                за один запрос, значение по умолчанию - 25
+        :rtype: массив с массивами, состоящими из одного кортежа, который в
+                свою очередь состоит из объекта oid и объекта значения
+        """
+
+        max_repetitions = kwargs.get('max_repetitions', 25)
+
+        with _generator(self._generator_key, self.ip) as cmd_gen:
+            errorIndication, errorStatus, errorIndex, varBinds = \
+                cmd_gen.bulkCmd(
+                    self.community_read,
+                    self.target,
+                    0,
+                    max_repetitions,
+                    *oids
+                )
+        if errorIndication:
+            raise SnmpGetTimeoutException(
+                self.ip, errorIndication
+            )
+        else:
+            if errorStatus:
+                raise SnmpOtherException(
+                    self.ip, '%s at %s' %
+                    (errorStatus.prettyPrint(),
+                     errorIndex and varBinds[int(errorIndex) - 1] or '?')
+                )
+            else:
+                if varBinds:
+                    return varBinds
+                else:
+                    raise SnmpOtherException(
+                        self.ip, 'указан неверный oid - %s' % (oids, )
+                    )
+
 
 class SnmpException(service.BasicException):
     """
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Разбор и раскрытие перечня целевого оборудования.
+
+Допустимые варианты записи:
+    10.0.0.1                 - одиночный адрес
+    10.0.0.0/24              - сеть, адреса сети и широковещательный адрес
+                               (для масок короче /31) исключаются
+    10.0.0.1-10.0.0.50       - диапазон адресов
+    10.0.0.1-50              - диапазон по последнему октету
+    !10.0.0.10               - исключение, любой из вариантов выше
+"""
+
+
+class Targets(object):
+    """
+    Класс перечня целевого оборудования.
+    Перечень хранится в виде диапазонов адресов, которые объединяются
+    перед обходом, поэтому повторы устраняются без хранения отдельных
+    адресов, а сами адреса формируются только при обходе.
+    """
+
+    def __init__(self, specs=(), exclude=()):
+        """
+        Конструктор класса.
+
+        :param specs: итератор строк с записями адресов
+        :param exclude: итератор строк с записями исключаемых адресов
+        """
+
+        self._include = []
+        self._exclude = []
+
+        for spec in specs:
+            self.add(spec)
+
+        for spec in exclude:
+            self.add(spec, exclude=True)
+
+    def add(self, spec, exclude=False):
+        """
+        Метод добавления записи в перечень.
+
+        :param spec: строка с записью адресов
+        :param exclude: исключить адреса из перечня
+        """
+
+        spec = spec.strip()
+        if spec.startswith('!'):
+            spec = spec[1:]
+            exclude = True
+
+        if exclude:
+            self._exclude.append(spec_parse(spec))
+        else:
+            self._include.append(spec_parse(spec))
+
+    def add_file(self, _file):
+        """
+        Метод добавления записей из файла. Записи разделяются пробельными
+        символами, запятыми или переводами строк, все после символа #
+        считается комментарием.
+
+        :param _file: файловый объект
+        """
+
+        for line in _file:
+            for spec in line.split('#')[0].replace(',', ' ').split():
+                self.add(spec)
+
+    def _ranges(self):
+        """
+        Метод получения диапазонов перечня за вычетом исключений.
+
+        :rtype: итератор кортежей из начального и конечного адреса
+                в виде целых чисел
+        """
+
+        self._include = ranges_merge(self._include)
+        self._exclude = ranges_merge(self._exclude)
+
+        for begin, end in self._include:
+            for ex_begin, ex_end in self._exclude:
+                if ex_end < begin or ex_begin > end:
+                    continue
+                if ex_begin > begin:
+                    yield begin, ex_begin - 1
+                begin = ex_end + 1
+                if begin > end:
+                    break
+            if begin <= end:
+                yield begin, end
+
+    def __iter__(self):
+        """
+        Метод обхода адресов перечня.
+
+        :rtype: итератор строк ip адресов
+        """
+
+        for begin, end in self._ranges():
+            for address in xrange(begin, end + 1):
+                yield int_2_ip(address)
+
+    def __len__(self):
+        """
+        Метод получения количества адресов в перечне без их раскрытия.
+        """
+
+        return sum(end - begin + 1 for begin, end in self._ranges())
+
+
+def ip_2_int(arg):
+    """
+    Функция преобразования строки ipv4 адреса в целое число
+    с проверкой правильности адреса.
+
+    :param arg: строка
+    :rtype: целое число
+    """
+
+    octets = arg.split('.')
+    if len(octets) != 4:
+        raise TargetException('неверный ip адрес - %s' % arg)
+
+    result = 0
+    for octet in octets:
+        if not octet.isdigit() or not 0 <= int(octet) <= 255:
+            raise TargetException('неверный ip адрес - %s' % arg)
+        result = result * 256 + int(octet)
+
+    return result
+
+
+def int_2_ip(arg):
+    """
+    Функция преобразования целого числа в строку ipv4 адреса.
+
+    :param arg: целое число
+    :rtype: строка
+    """
+
+    return '%d.%d.%d.%d' % (
+        arg >> 24, (arg >> 16) & 255, (arg >> 8) & 255, arg & 255
+    )
+
+
+def spec_parse(spec):
+    """
+    Функция разбора записи адресов.
+
+    :param spec: строка с записью адресов
+    :rtype: кортеж из начального и конечного адреса в виде целых чисел
+    """
+
+    if '/' in spec:
+        address, prefix = spec.split('/', 1)
+        if not prefix.isdigit() or not 0 <= int(prefix) <= 32:
+            raise TargetException('неверная маска сети - %s' % spec)
+        prefix = int(prefix)
+        mask = (0xffffffff << (32 - prefix)) & 0xffffffff
+        begin = ip_2_int(address) & mask
+        end = begin | (~mask & 0xffffffff)
+        if prefix < 31:
+            begin, end = begin + 1, end - 1
+        return begin, end
+
+    if '-' in spec:
+        first, last = spec.split('-', 1)
+        begin = ip_2_int(first)
+        if last.isdigit() and int(last) <= 255:
+            end = (begin & 0xffffff00) | int(last)
+        else:
+            end = ip_2_int(last)
+        if end < begin:
+            raise TargetException('неверный диапазон адресов - %s' % spec)
+        return begin, end
+
+    address = ip_2_int(spec)
+    return address, address
+
+
+def ranges_merge(ranges):
+    """
+    Функция объединения пересекающихся и смежных диапазонов.
+
+    :param ranges: массив кортежей из начального и конечного значения
+    :rtype: отсортированный массив непересекающихся кортежей
+    """
+
+    result = []
+
+    for begin, end in sorted(ranges):
+        if result and begin <= result[-1][1] + 1:
+            if end > result[-1][1]:
+                result[-1] = (result[-1][0], end)
+        else:
+            result.append((begin, end))
+
+    return result
+
+
+class TargetException(Exception):
+    """
+    Базовое исключение.
+    """
+    pass
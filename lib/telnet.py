@@ -5,6 +5,7 @@ import telnetlib
 import time
 import socket
 
+import metrics
 import service
 from logger import logger
 
@@ -42,6 +43,8 @@ class Telnet(object):
         self.success_prompt = 'Success'
         self.greet_str = None
         self.user = None
+        # время появления строки приветствия после авторизации в секундах
+        self.latency = None
         self.telnet = telnetlib.Telnet()
 
         self._is_open = False
@@ -63,6 +66,7 @@ class Telnet(object):
                 '%s - telnet соединение успешно установлено' % self.ip
             )
 
+    @metrics.timed('telnet_login')
     def login(self, user, passwd, exp_timeout=5):
         """
         Метод для авторизации на оборудовании.
@@ -85,6 +89,7 @@ class Telnet(object):
                 time.sleep(0.2)
             self.telnet.write(passwd + '\n')
 
+            start = time.time()
             self.greet_str = self.get_greet_str()
 
             if not self.greet_str:
@@ -96,6 +101,7 @@ class Telnet(object):
                     '%s - авторизация прошла успешно - %s' % (self.ip, user)
                 )
                 self._is_login = True
+                self.latency = time.time() - start
                 # хак для некоторого типа оборудования
                 # проблема заключалась в том что оборудование подставляло
                 # первый символ пароля в начало первой команды несколько раз (1-3)
@@ -128,6 +134,7 @@ class Telnet(object):
         for cmd in args:
             if isinstance(cmd, unicode):
                 cmd = str(cmd)
+            start = time.time()
             self.telnet.write('%s\n' % cmd)
 
             try:
@@ -136,11 +143,13 @@ class Telnet(object):
                 logger.warning(exc)
             else:
                 if self.success_prompt in recv:
+                    metrics.observe('telnet_command', time.time() - start)
                     logger.info(
                         '%s - %s - команда выполнена успешно' % (self.ip, cmd)
                     )
                     continue
 
+            metrics.observe('telnet_command', time.time() - start, False)
             logger.warning(
                 '%s - команда выполнена неуспешно - %s' %
                 (self.ip, cmd)
@@ -155,6 +164,7 @@ class Telnet(object):
                 self.telnet.write('\032')
                 self.listen()
 
+    @metrics.timed('telnet_save')
     def save_config(self):
         """
         Метод сохранения конфигурационного файла
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Хранение наблюдаемых задержек оборудования и вычисление по ним таймаутов.
+
+Для каждого оборудования хранятся последние значения задержек по видам:
+    ping - наибольшее время ответа на icmp запрос
+    snmp - наибольшее время ответа на snmp запрос
+    tftp - время получения конфигурационного файла через TFTP сервер
+    save - время сохранения конфигурации
+    telnet - время появления строки приветствия после авторизации
+
+Таймаут вычисляется как 99-й процентиль задержек, умноженный на
+коэффициент, и ограничивается минимальным и максимальным значениями.
+Пока задержек недостаточно, используется таймаут по умолчанию.
+"""
+
+
+import json
+import math
+import os
+import threading
+
+
+# таймаут по умолчанию, минимальный и максимальный таймауты в секундах
+# таймаут ping - время ожидания каждого ответа, по умолчанию не задается
+limits = {
+    'ping': (None, 1, 5),
+    'snmp': (3, 0.5, 5),
+    'tftp': (10, 3, 60),
+    'save': (15, 5, 60),
+    'telnet': (5, 2, 15)
+}
+
+# виды задержек, таймауты которых используются как целое количество секунд
+whole_seconds = ['ping', 'tftp', 'save', 'telnet']
+
+
+class Timings(object):
+    """
+    Класс хранения задержек оборудования.
+    """
+
+    def __init__(self, path=None, factor=3, samples=50, min_samples=3,
+                 limits=limits):
+        """
+        Конструктор класса.
+
+        :param path: путь к файлу задержек, если не указан - задержки
+                     не сохраняются и используются таймауты по умолчанию
+        :param factor: коэффициент, на который умножается 99-й процентиль
+        :param samples: количество хранимых значений каждого вида
+        :param min_samples: количество значений, начиная с которого
+                            таймаут вычисляется по задержкам
+        :param limits: словарь таймаутов по умолчанию, минимальных и
+                       максимальных таймаутов по видам задержек
+        """
+
+        self.path = path
+        self.factor = factor
+        self.samples = samples
+        self.min_samples = min_samples
+        self.limits = limits
+        self._lock = threading.Lock()
+        self._data = {}
+
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as _f:
+                    self._data = json.load(_f)
+            except (IOError, ValueError) as exc:
+                raise TimingsException(exc)
+
+    def add(self, ip, latency):
+        """
+        Метод добавления задержек оборудования.
+
+        :param ip: ip адрес оборудования
+        :param latency: словарь задержек в секундах по видам
+        """
+
+        if not self.path:
+            return
+
+        with self._lock:
+            device = self._data.setdefault(ip, {})
+            for kind, value in latency.iteritems():
+                if value is None:
+                    continue
+                values = device.setdefault(kind, [])
+                values.append(round(value, 3))
+                del values[:-self.samples]
+
+    def timeout(self, ip, kind):
+        """
+        Метод вычисления таймаута оборудования.
+
+        :param ip: ip адрес оборудования
+        :param kind: вид задержки
+        :rtype: таймаут в секундах
+        """
+
+        default, floor, ceiling = self.limits[kind]
+
+        with self._lock:
+            values = sorted(self._data.get(ip, {}).get(kind, ()))
+
+        if len(values) < self.min_samples:
+            result = default
+        else:
+            # 99-й процентиль по методу ближайшего ранга
+            p99 = values[int(math.ceil(0.99 * len(values))) - 1]
+            result = min(max(p99 * self.factor, floor), ceiling)
+
+        if result is not None and kind in whole_seconds:
+            return int(math.ceil(result))
+        return result
+
+    def timeouts(self, ip):
+        """
+        Метод вычисления всех таймаутов оборудования.
+
+        :param ip: ip адрес оборудования
+        :rtype: словарь таймаутов по видам задержек
+        """
+
+        return dict((kind, self.timeout(ip, kind)) for kind in self.limits)
+
+    def save(self):
+        """
+        Метод сохранения задержек в файл. Файл записывается под временным
+        именем и затем переименовывается, чтобы прерванная запись
+        не повредила ранее сохраненные задержки.
+        """
+
+        if not self.path:
+            return
+
+        tmp_path = self.path + '.tmp'
+
+        try:
+            with self._lock:
+                with open(tmp_path, 'w') as _f:
+                    json.dump(self._data, _f, sort_keys=True)
+                os.rename(tmp_path, self.path)
+        except EnvironmentError as exc:
+            raise TimingsException(exc)
+
+
+class TimingsException(Exception):
+    """
+    Базовое исключение.
+    """
+    pass
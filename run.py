@@ -6,176 +6,1436 @@
 This is a tool to collect D-link's equipment configuration files
 
 usage:
-    run.py get-conf (<ip> ... | -i <file>) [-o <path>]
-    run.py tune [-n] <ip> [<file>]
+    run.py get-conf (<ip> ... | -i <file>) [-x <list>] [-o <path> | -a <path>] [--history <path>] [-u] [--save-ports] [-f <format>] [-w <n>] [-t <path>] [--resume <journal>] [--metrics <path>]
+    run.py tune [-n] [-m <method>] [-s <source>] [-f <format>] [-w <n>] [-t <path>] [--resume <journal>] [--metrics <path>] [--waves <sizes> [--halt-ratio <ratio>]] [-x <list>] (-i <file> | <ip>) [<file>]
+    run.py apply [-m <method>] [-f <format>] [-w <n>] [-t <path>] [--resume <journal>] [--metrics <path>] [--waves <sizes> [--halt-ratio <ratio>]] <plan>
+    run.py plan [-f <format>] [--ports <dir>] [--profile <file>] <config> ...
+    run.py audit [-f <format>] [-w <n>] [--ports <dir>] [--profile <file>] <config> ...
+    run.py index [-w <n>] [--ports <dir>] <db> <config> ...
+    run.py query [-f <format>] <db> <sql> [<param> ...]
+    run.py history <dir> (<ip> [<date>] | -c <day>)
+    run.py discover (<ip> ... | -i <file>) [-x <list>] [-o <path>] [-w <n>] [-r <rate>]
+    run.py serve <socket>
 
 arguments:
     get-conf                  get configuration file from target equipment
     tune                      tune target equipment
-    <ip>                      ip address of target equipment or sequence, separated by space
+    apply                     execute commands of reviewed plan file <plan>, which is ndjson
+                              output of tune -n (with --source config), plan or audit,
+                              before executing configuration file is downloaded and its
+                              hash is compared with the planned one, equipment with changed
+                              configuration is skipped with status "changed"
+    plan                      print commands, that tune -n would print, computed from
+                              stored configuration files <config> named <ip>.cfg and
+                              port maps saved by get-conf --save-ports, without any
+                              access to equipment
+    audit                     same as plan for large number of configuration files, <config>
+                              can also be a directory with *.cfg files, files are parsed
+                              by --workers processes, summary is printed at the end
+    index                     parse stored configuration files <config> (or directories
+                              with *.cfg files) by --workers processes and store chassis
+                              and port options to SQLite database <db>, files unchanged
+                              since previous run are skipped, equipment which files are
+                              missing from <config> or failed to parse is removed
+    query                     run SQL query <sql> with parameters <param> against options
+                              database <db>, tables:
+                                 devices (ip, eqp_type, config_hash, updated)
+                                 ports (ip, port, name, port_type)
+                                 options (ip, port, key, option, value)
+                              port_type: 0 - trunk, 1 - access; port 0 - chassis option;
+                              nested options are joined by dot (instance_id.0.priority)
+                              example - access ports with loopdetect disabled:
+                                 "SELECT o.ip, p.name FROM options o JOIN ports p
+                                  USING (ip, port) WHERE p.port_type = 1
+                                  AND o.key = 'loopdetect' AND o.option = 'state'
+                                  AND o.value = 'disabled'"
+    history                   print configuration file of equipment from history
+                              directory <dir> at the <date> or all changes at the <day>
+    discover                  find d-link equipment via snmp and write inventory file,
+                              that can be used as --input-file, to output destination
+                              (/dev/stdout by default)
+    serve                     run as a service accepting get-conf, tune and apply jobs on
+                              unix socket <socket>, modules, settings and connections stay
+                              loaded between jobs, jobs are sent by client.py
+    <ip>                      ip address of target equipment or sequence, separated by space,
+                              each element can be single address (10.0.0.1), CIDR block
+                              (10.0.0.0/24, network and broadcast addresses are skipped),
+                              range (10.0.0.1-10.0.0.50 or 10.0.0.1-50) or exclusion,
+                              prefixed by ! (!10.0.0.10)
     <file>                    config file in json format such as default.json.sample
                               if don't use this option будет will be use settings_dir_path
                               parameter from settings.py
+    <date>                    date and time in UTC, format YYYY-MM-DD [HH:MM:SS],
+                              if time is omitted - the end of the day,
+                              if date is omitted - the latest version
 
 options:
     -h --help                 show this screen
-    -i --input-file <file>    file with ip addresses, separated by carrier return
+    -i --input-file <file>    file with ip addresses in any form allowed for <ip>,
+                              separated by carrier return, space or comma,
+                              text after # is a comment
+    -x --exclude <list>       addresses to exclude in any form allowed for <ip>,
+                              separated by comma
+    -w --workers <n>          number of equipment processed concurrently [default: 1]
     -o --output <path>        output destination, can be path to file, if single ip,
                               or path to directory, if ip sequence or input-file option
                               is present; defaults:
                                  /dev/stdout for single ip,
                                  ./ for ip sequence or --input-file option
+    -t --timings <path>       file of observed equipment latencies (ping, snmp, TFTP,
+                              save and telnet), latencies are recorded to it and
+                              timeouts are derived from them as 99th percentile
+                              multiplied by timeout_factor from settings.py
+    -r --rate <rate>          maximum number of snmp requests per second while
+                              discovering, 0 - unlimited [default: 50]
+    -a --archive <path>       store configuration files in compressed content-addressed
+                              archive in directory <path> instead of output destination
+    --history <path>          also store configuration files in history directory <path>
+                              with periodic snapshots and line-level deltas
+    --resume <journal>        journal file of processed equipment, equipment already
+                              successfully processed by the same command is skipped,
+                              results are appended to the journal, so interrupted run
+                              can be continued with the same option, dry runs (tune -n)
+                              are journaled separately from real ones
+    --metrics <path>          write histograms of phase durations (ping, snmp requests, TFTP
+                              wait for configuration file, ssh connect, parse, plan, telnet
+                              login, each command, script file execution, save) to
+                              Prometheus textfile <path> (*.prom for node_exporter)
+                              and their summary to json file next to it, not available in
+                              service mode
+    --waves <sizes>           roll out changes in waves of growing size, separated by comma,
+                              the rest of equipment is processed by the last wave, e.g.
+                              1,10,100, each wave is processed by --workers threads,
+                              throughput and failures are reported after each wave
+    --halt-ratio <ratio>      stop rollout after the wave, in which share of equipment
+                              failed while applying commands exceeds <ratio>, the share
+                              is counted among equipment commands were sent to, errors
+                              before applying (connection, file transfer, planning) and
+                              equipment which doesn't need tuning are reported, but not
+                              counted [default: 0.1]
+    --save-ports              also save port map of equipment next to configuration file
+                              for plan command
+    --ports <dir>             directory with port maps, by default port maps are looked
+                              for next to configuration files
+    --profile <file>          config file in json format such as default.json.sample,
+                              if don't use this option will be use settings_dir_path
+                              parameter from settings.py
+    -c --changes <day>        day in format YYYY-MM-DD (UTC)
+    -u --skip-unchanged       don't get configuration file if equipment configuration
+                              wasn't changed since previous file was saved, requires
+                              not empty fingerprint_oids parameter in settings.py
     -n --dry-run              print commands without execute it on equipment
+    -m --method <method>      method of applying commands to equipment:
+                                 telnet - execute commands one by one via telnet
+                                 tftp - load commands as a single script file
+                                        from TFTP server via snmp
+                                 snmp - set options via snmp where it's possible,
+                                        the rest of commands execute via telnet
+                              [default: telnet]
+    -s --source <source>      source of equipment current state:
+                                 config - download and parse configuration file
+                                 snmp - read options state via snmp,
+                                        traffic_segmentation and dhcp_local_relay
+                                        can't be read via snmp, so they are
+                                        not tuned with this source
+                              [default: config]
+    -f --format <format>      output format:
+                                 text - colored log lines
+                                 ndjson - one json record per equipment as soon as
+                                          it's processed, log lines go to stderr
+                              [default: text]
 """
 
 
 import sys
 import logging
 import os
+import time
+import calendar
+import collections
+import hashlib
+import json
+import contextlib
+import socket
+import stat
 
 from docopt import docopt
 
 import settings
-from lib import dlink, json_config, ping, telnet
+from lib import fingerprint, journal, lazy, metrics, ping, pool, portmap, scheduler, targets, timings
 from lib.logger import logger, ColoredFormatter
 
 
-def ip_validate(arg):
+# модули, загружающие ssh, snmp и разбор конфигурационных файлов или
+# нужные только части команд, импортируются при первом использовании
+archive = lazy.LazyModule('lib.archive')
+dlink = lazy.LazyModule('lib.dlink')
+history = lazy.LazyModule('lib.history')
+index = lazy.LazyModule('lib.index')
+json_config = lazy.LazyModule('lib.json_config')
+telnet = lazy.LazyModule('lib.telnet')
+
+
+def time_parse(arg):
     """
-    Валидация ipv4 адресов
+    Преобразование строки даты и времени в UTC в количество секунд
+    от начала эпохи, если время не указано - конец суток
     """
 
-    octets = arg.split('.')
-    if len(octets) != 4:
-        return False
-    else:
-        for octet in octets:
-            if not octet.isdigit() or not 0 <= int(octet) <= 255:
-                return False
-        return True
+    try:
+        return calendar.timegm(time.strptime(arg, '%Y-%m-%d %H:%M:%S'))
+    except ValueError:
+        pass
+
+    try:
+        return calendar.timegm(time.strptime(arg, '%Y-%m-%d')) + 86399
+    except ValueError:
+        return None
+
+@contextlib.contextmanager
+def timing(record, phase):
+    """
+    Измерение длительности этапа работы с оборудованием
+    """
+
+    start = time.time()
+    try:
+        yield
+    finally:
+        record['timings'][phase] = round(time.time() - start, 3)
+
+def config_hash(config):
+    """
+    Хэш конфигурационного файла, по которому проверяется, что
+    конфигурация не изменилась с момента формирования команд
+    """
+
+    return hashlib.sha1(config).hexdigest()
+
+def emit(record, fmt, output=sys.stdout):
+    """
+    Вывод результата работы с оборудованием
+    """
+
+    if fmt == 'ndjson':
+        output.write(json.dumps(record) + '\n')
+        output.flush()
 
-def eqp_gen(arg):
+def run_job(job, ip, args, env):
     """
-    Генератор инстансов класса Dlink
+    Выполнение задания над оборудованием в потоке пула, непредусмотренное
+    исключение становится записью об ошибке оборудования и не прерывает
+    обработку остального оборудования
     """
 
-    for _ip in arg:
+    try:
+        return job(ip, args, env)
+    except Exception as exc:
+        logger.exception('%s - unexpected error - %r' % (ip, exc))
+        return {
+            'ip': ip,
+            'eqp_type': None,
+            'firmware': None,
+            'status': 'error',
+            'error': 'unexpected error - %s' % exc,
+            'timings': {},
+            'latency': {}
+        }
+
+def transfer(equipment, env, record, func, *args):
+    """
+    Передача файла между оборудованием и TFTP сервером
+    с учетом ограничений количества одновременных передач,
+    при ошибке сервера передача повторяется через другой сервер
+    """
+
+    failed = []
+
+    while 1:
+        start = time.time()
         try:
-            ping.ping(_ip)
-        except ping.PingException as _exc:
-            logger.error(_exc)
+            with env['scheduler'].slot(equipment.ip, failed) as server:
+                record['timings']['queue'] = round(
+                    record['timings'].get('queue', 0) + time.time() - start, 3
+                )
+                equipment.set_tftp_server(**server)
+                record['tftp_server'] = server['tftp_server']
+                result = func(*args)
+                record['latency'].update(equipment.latency)
+                return result
+        except dlink.DlinkTftpException as exc:
+            failed.append(server['tftp_server'])
+            if len(failed) >= len(env['scheduler'].servers):
+                raise
+            logger.warning(
+                '%s, retry via another TFTP server' % exc
+            )
+        except scheduler.SchedulerException as exc:
+            # для оборудования не осталось TFTP сервера, это ошибка
+            # оборудования, а не всего запуска
+            logger.debug(exc)
+            raise dlink.DlinkConfigException(
+                equipment.ip, 'нет доступных TFTP серверов'
+            )
+
+def connect(ip, record, timeouts):
+    """
+    Проверка доступности оборудования, создание инстанса класса Dlink
+    и определение типа оборудования
+    """
+
+    with timing(record, 'ping'):
+        resp = ping.ping(ip, timeout=timeouts['ping'])
+    if resp.rtt is not None:
+        record['latency']['ping'] = resp.rtt
+
+    equipment = dlink.Dlink(
+        ip, snmp_timeout=timeouts['snmp'], **settings.__dict__
+    )
+
+    with timing(record, 'identify'):
+        record['eqp_type'] = equipment.get_eqp_type()
+        record['firmware'] = equipment.get_firmware_version()
+    record['latency']['snmp'] = equipment.snmp.latency
+
+    return equipment
+
+def get_conf(ip, args, env):
+    """
+    Получение конфигурационного файла оборудования
+    """
+
+    record = {
+        'ip': ip,
+        'eqp_type': None,
+        'firmware': None,
+        'status': 'error',
+        'timings': {},
+        'latency': {}
+    }
+    timeouts = env['timings'].timeouts(ip)
+
+    try:
+        equipment = connect(ip, record, timeouts)
+    except ping.PingException as exc:
+        logger.error(exc)
+        record['status'] = 'unreachable'
+        record['error'] = str(exc)
+        return record
+    except dlink.DlinkInitException as exc:
+        logger.error(exc)
+        record['error'] = str(exc)
+        return record
+
+    cfg_archive = env['archive']
+    cfg_history = env['history']
+    path = None
+    eqp_fingerprint = None
+    old_fingerprint = None
+
+    if cfg_archive:
+        ref = cfg_archive.get_ref(ip)
+        old_fingerprint = ref and ref['fingerprint']
+    elif env['dir_path']:
+        if env['single']:
+            path = env['dir_path'] if not args['--output'] \
+                else os.path.join(env['dir_path'], env['file_path'])
         else:
-            yield dlink.Dlink(_ip, **settings.__dict__)
+            path = os.path.join(env['dir_path'], ip + '.cfg')
+        old_fingerprint = os.path.exists(path) and fingerprint.load(path)
 
-if __name__ == '__main__':
-    logger.setLevel(settings.log_level)
-    formatter = ColoredFormatter(
-        fmt='%(asctime)s   %(levelname)-8s   %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
+    if env['skip_unchanged']:
+        with timing(record, 'fingerprint'):
+            eqp_fingerprint = equipment.get_fingerprint()
+        if fingerprint.is_unchanged(old_fingerprint, eqp_fingerprint):
+            logger.info(
+                '%s - configuration not changed, skipped' % ip
+            )
+            if cfg_archive:
+                cfg_archive.keep(ip)
+            record['status'] = 'skipped'
+            return record
+
+    # набор портов определяется во время передачи файла
+    if args['--save-ports'] and path and path != '/dev/stdout':
+        equipment.start_ports()
+
+    try:
+        with timing(record, 'config'):
+            config = transfer(
+                equipment, env, record, equipment.get_config, timeouts['tftp']
+            )
+    except dlink.DlinkConfigException as exc:
+        logger.error(exc)
+        record['error'] = str(exc)
+        return record
+
+    with timing(record, 'store'):
+        try:
+            if cfg_history:
+                cfg_history.put(ip, config)
+
+            if cfg_archive:
+                digest, changed = cfg_archive.put(ip, config, eqp_fingerprint)
+                record['hash'] = digest
+                if not changed:
+                    logger.info(
+                        '%s - configuration not changed' % ip
+                    )
+            elif path:
+                with open(path, 'w') as _f:
+                    _f.write(config)
+                if env['skip_unchanged']:
+                    fingerprint.dump(path, eqp_fingerprint)
+                if args['--save-ports'] and path != '/dev/stdout':
+                    ports = equipment.dump_ports()
+                    if ports:
+                        portmap.dump(path, ports)
+        except (history.HistoryException,
+                archive.ArchiveException,
+                EnvironmentError) as exc:
+            logger.error(exc)
+            record['error'] = str(exc)
+            return record
+
+    if args['--format'] == 'ndjson':
+        record['config'] = config.decode('utf-8', 'replace')
+
+    record['status'] = 'ok'
+    return record
+
+def tune(ip, args, env):
+    """
+    Настройка оборудования
+    """
+
+    record = {
+        'ip': ip,
+        'eqp_type': None,
+        'firmware': None,
+        'status': 'error',
+        'timings': {},
+        'latency': {}
+    }
+    timeouts = env['timings'].timeouts(ip)
+
+    session = None
+    # сессия, не переданная apply_commands, закрывается при любом
+    # завершении, в том числе при непредусмотренных исключениях
+    handed = False
+    try:
+        try:
+            equipment = connect(ip, record, timeouts)
+
+            # авторизация по telnet выполняется во время получения
+            # конфигурационного файла и формирования команд
+            if args['--method'] == 'telnet' and not args['--dry-run']:
+                session = pool.Background(telnet_session, equipment, timeouts)
+
+            if args['<file>']:
+                options = json_config.Config.get_options(args['<file>'])
+            else:
+                options = env['config'].load_options(equipment.eqp_type)
+
+            if args['--source'] == 'config':
+                # набор портов определяется во время передачи файла
+                equipment.start_ports()
+                with timing(record, 'config'):
+                    config = transfer(
+                        equipment, env, record,
+                        equipment.get_config, timeouts['tftp']
+                    )
+                record['config_hash'] = config_hash(config)
+
+            with timing(record, 'plan'):
+                cmd = equipment.analyze_config(
+                    options, args['--source'], env['plan_cache']
+                )
+
+        except ping.PingException as exc:
+            logger.error(exc)
+            record['status'] = 'unreachable'
+            record['error'] = str(exc)
+            return record
+        except (json_config.ConfigException,
+                dlink.DlinkInitException,
+                dlink.DlinkConfigException) as exc:
+            logger.error(exc)
+            record['error'] = str(exc)
+            return record
+
+        record['commands'] = cmd
+
+        if not cmd:
+            logger.info('%s - tune not required' % ip)
+            record['status'] = 'ok'
+            return record
+
+        if args['--dry-run']:
+            if args['--format'] == 'text':
+                print cmd
+            record['status'] = 'ok'
+            return record
+
+        handed = True
+        with timing(record, 'apply'):
+            try:
+                apply_commands(
+                    equipment, cmd, args['--method'], env, record, timeouts,
+                    session
+                )
+            except (dlink.DlinkConfigException,
+                    telnet.TelnetConnException,
+                    telnet.TelnetLoginException) as exc:
+                logger.error(exc)
+                record['error'] = str(exc)
+                return record
+
+        record['status'] = 'ok'
+        return record
+    finally:
+        if session and not handed:
+            session.discard(lambda conn: conn.close())
+
+def apply_plan(ip, args, env):
+    """
+    Выполнение команд из файла плана, если конфигурация оборудования
+    не изменилась с момента формирования команд
+    """
+
+    entry = env['plan'][ip]
+    record = {
+        'ip': ip,
+        'eqp_type': None,
+        'firmware': None,
+        'status': 'error',
+        'timings': {},
+        'latency': {},
+        'commands': entry['commands']
+    }
+    timeouts = env['timings'].timeouts(ip)
+
+    session = None
+    # сессия, не переданная apply_commands, закрывается при любом
+    # завершении, в том числе при непредусмотренных исключениях
+    handed = False
+    try:
+        try:
+            equipment = connect(ip, record, timeouts)
+
+            if equipment.eqp_type != entry['eqp_type']:
+                raise dlink.DlinkConfigException(
+                    ip, 'тип оборудования не совпадает с планом - %s' %
+                    entry['eqp_type']
+                )
+
+            if args['--method'] == 'telnet':
+                session = pool.Background(telnet_session, equipment, timeouts)
+
+            with timing(record, 'config'):
+                config = transfer(
+                    equipment, env, record,
+                    equipment.get_config, timeouts['tftp']
+                )
+            record['config_hash'] = config_hash(config)
+
+        except ping.PingException as exc:
+            logger.error(exc)
+            record['status'] = 'unreachable'
+            record['error'] = str(exc)
+            return record
+        except (dlink.DlinkInitException,
+                dlink.DlinkConfigException) as exc:
+            logger.error(exc)
+            record['error'] = str(exc)
+            return record
+
+        if record['config_hash'] != entry['config_hash']:
+            logger.error('%s - configuration changed since planning' % ip)
+            record['status'] = 'changed'
+            record['error'] = 'configuration changed since planning'
+            return record
+
+        handed = True
+        with timing(record, 'apply'):
+            try:
+                apply_commands(
+                    equipment, entry['commands'], args['--method'], env,
+                    record, timeouts, session
+                )
+            except (dlink.DlinkConfigException,
+                    telnet.TelnetConnException,
+                    telnet.TelnetLoginException) as exc:
+                logger.error(exc)
+                record['error'] = str(exc)
+                return record
+
+        record['status'] = 'ok'
+        return record
+    finally:
+        if session and not handed:
+            session.discard(lambda conn: conn.close())
+
+def load_plan(path):
+    """
+    Чтение файла плана - записей ndjson команд tune -n, plan или audit,
+    в план попадает оборудование с командами и хэшем конфигурации
+    """
+
+    plans = collections.OrderedDict()
+    with open(path, 'r') as _f:
+        for line in _f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.get('status') != 'ok' or not record.get('commands'):
+                continue
+            if not record.get('config_hash'):
+                logger.warning(
+                    '%s - no configuration hash in plan, skipped' %
+                    record['ip']
+                )
+                continue
+            plans[str(record['ip'])] = {
+                'eqp_type': record['eqp_type'],
+                'config_hash': str(record['config_hash']),
+                'commands': [
+                    cmd.encode('utf-8') for cmd in record['commands']
+                ]
+            }
+    return plans
+
+def config_ip(path):
+    """
+    Получение ip адреса оборудования из имени сохраненного
+    конфигурационного файла <ip>.cfg
+    """
+
+    name = os.path.basename(path)
+    return name[:-len('.cfg')] if name.endswith('.cfg') else name
+
+def stored_equipment(path, args, record):
+    """
+    Загрузка сохраненных конфигурационного файла и набора портов
+    оборудования, при ошибке возвращает None
+    """
+
+    name = os.path.basename(path)
+    ip = config_ip(path)
+    record['ip'] = ip
+
+    try:
+        targets.ip_2_int(ip)
+    except targets.TargetException:
+        logger.error('%s - file name must be <ip>.cfg' % path)
+        record['error'] = 'not valid file name'
+        return None
+
+    ports_path = os.path.join(args['--ports'], name) if args['--ports'] \
+        else path
+    ports = portmap.load(ports_path)
+    if not ports:
+        logger.error('%s - port map not found' % ip)
+        record['error'] = 'port map not found'
+        return None
+
+    try:
+        with open(path, 'r') as _f:
+            cfg_file = _f.read()
+
+        equipment = dlink.Dlink(ip, **settings.__dict__)
+        equipment.load_config(cfg_file, ports)
+    except IOError as exc:
+        logger.error(exc)
+        record['error'] = str(exc)
+        return None
+    except dlink.DlinkConfigException as exc:
+        logger.error(exc)
+        record['error'] = str(exc)
+        return None
+
+    record['eqp_type'] = equipment.eqp_type
+    record['config_hash'] = config_hash(equipment.chassis.config_file)
+
+    return equipment
+
+def plan(path, args, config, cache):
+    """
+    Формирование команд настройки оборудования по сохраненным
+    конфигурационному файлу и набору портов
+    """
+
+    record = {
+        'ip': None,
+        'eqp_type': None,
+        'status': 'error',
+        'timings': {}
+    }
+
+    equipment = stored_equipment(path, args, record)
+    if not equipment:
+        return record
+
+    try:
+        if args['--profile']:
+            options = json_config.Config.get_options(args['--profile'])
+        else:
+            options = config.load_options(equipment.eqp_type)
+
+        with timing(record, 'plan'):
+            record['commands'] = equipment.analyze_config(
+                options, cache=cache
+            )
+
+    except IOError as exc:
+        logger.error(exc)
+        record['error'] = str(exc)
+        return record
+    except (json_config.ConfigException,
+            dlink.DlinkConfigException) as exc:
+        logger.error(exc)
+        record['error'] = str(exc)
+        return record
+
+    record['status'] = 'ok'
+    return record
+
+# аргументы команд audit и index в процессах пула
+_audit = {}
+
+def audit_init(args, config):
+    """
+    Инициализация процесса пула команд audit и index
+    """
+
+    _audit['args'] = args
+    _audit['config'] = config
+    _audit['cache'] = {}
+
+def audit_job(path):
+    """
+    Формирование команд настройки оборудования в процессе пула
+    """
+
+    return plan(path, _audit['args'], _audit['config'], _audit['cache'])
+
+def index_job(item):
+    """
+    Разбор сохраненного конфигурационного файла в строки индекса
+    опций в процессе пула, если хэш конфигурации не совпадает
+    с проиндексированным
+    """
+
+    path, indexed_hash = item
+
+    record = {
+        'ip': None,
+        'eqp_type': None,
+        'status': 'error',
+        'timings': {}
+    }
+
+    equipment = stored_equipment(path, _audit['args'], record)
+    if not equipment:
+        return record
+
+    # хэш индекса учитывает набор портов, от которого зависят типы портов
+    record['config_hash'] = hashlib.sha1(
+        record['config_hash'] +
+        json.dumps(equipment.dump_ports(), sort_keys=True)
+    ).hexdigest()
+    if record['config_hash'] == indexed_hash:
+        record['status'] = 'skipped'
+        return record
+
+    try:
+        with timing(record, 'parse'):
+            equipment.parse_config()
+    except dlink.DlinkConfigException as exc:
+        logger.error(exc)
+        record['error'] = str(exc)
+        return record
+
+    record['ports'], record['options'] = index.rows(
+        equipment.chassis, equipment.ports
     )
-    stdout_log = logging.StreamHandler(sys.stdout)
-    stdout_log.setFormatter(formatter)
-    logger.addHandler(stdout_log)
+    record['status'] = 'ok'
+    return record
 
-    args = docopt(__doc__)
+def telnet_session(equipment, timeouts):
+    """
+    Открытие telnet сессии с авторизацией на оборудовании
+    """
+
+    conn = telnet.Telnet(
+        equipment.ip,
+        timeout=timeouts['telnet'] * 2,
+        eqp_type=equipment.eqp_type
+    )
+    try:
+        conn.login(
+            settings.telnet_username,
+            settings.telnet_password,
+            exp_timeout=timeouts['telnet']
+        )
+    except Exception:
+        conn.close()
+        raise
+    return conn
+
+def apply_commands(equipment, cmd, method, env, record, timeouts,
+                   session=None):
+    """
+    Выполнение команд на оборудовании и сохранение конфигурации,
+    session - telnet сессия, открываемая заранее в фоне
+    """
 
-    ip_addrs = args['<ip>']
+    if method == 'snmp':
+        cmd = equipment.set_options(cmd)
+        if not cmd:
+            equipment.save_config(timeouts['save'])
+            record['latency'].update(equipment.latency)
+            return
 
-    if args['--input-file']:
+    if method == 'tftp':
+        transfer(equipment, env, record, equipment.load_commands, cmd)
+        equipment.save_config(timeouts['save'])
+        record['latency'].update(equipment.latency)
+    else:
+        if session:
+            conn = session.result()
+        else:
+            conn = telnet_session(equipment, timeouts)
+        record['latency']['telnet'] = conn.latency
         try:
+            conn.exec_cmd(*cmd)
+            conn.save_config()
+        finally:
+            conn.close()
+
+def make_scheduler():
+    """
+    Создание планировщика передач файлов через TFTP серверы
+    """
+
+    tftp_servers = getattr(settings, 'tftp_servers', None) or [{
+        'tftp_server': settings.tftp_server,
+        'config_load_method': settings.config_load_method,
+        'tftp_path': settings.tftp_path,
+        'username': settings.username,
+        'password': settings.password
+    }]
+
+    try:
+        return scheduler.Scheduler(
+            tftp_servers,
+            getattr(settings, 'tftp_balance', 'least'),
+            getattr(settings, 'tftp_max_transfers', 0),
+            getattr(settings, 'tftp_server_max_transfers', 0),
+            getattr(settings, 'tftp_site_max_transfers', 0),
+            getattr(settings, 'tftp_sites', {})
+        )
+    except targets.TargetException as exc:
+        logger.critical('Not valid tftp_sites - %s' % exc)
+        sys.exit(1)
+    except scheduler.SchedulerException as exc:
+        logger.critical(exc)
+        sys.exit(1)
+
+def main(args, output=sys.stdout, shared=None):
+    """
+    Выполнение команды, в режиме сервиса ограничения передач файлов и
+    задержки оборудования разделяются между заданиями через shared
+    """
+
+    if shared is None:
+        shared = {}
+
+    # проверка ip адресов, сами адреса формируются по мере обработки
+    ip_addrs = targets.Targets()
+    try:
+        if args['--input-file']:
             with open(args['--input-file'], 'r') as _f:
-                ip_addrs = [ip.strip() for ip in _f.readlines()]
-        except IOError as exc:
-            logger.critical(exc)
-            sys.exit(0)
-
-    # проверка ip адресов
-    not_valid_ip = False
-    for ip in ip_addrs:
-        if not ip_validate(ip):
-            logger.error(
-                'Not valid ip address - %s' % ip
-            )
-            not_valid_ip = True
+                ip_addrs.add_file(_f)
+        elif args['history']:
+            if args['<ip>']:
+                targets.ip_2_int(args['<ip>'][0])
+        else:
+            for spec in args['<ip>']:
+                ip_addrs.add(spec)
 
-    if not_valid_ip:
+        if args['--exclude']:
+            for spec in args['--exclude'].split(','):
+                ip_addrs.add(spec, exclude=True)
+    except IOError as exc:
+        logger.critical(exc)
+        sys.exit(0)
+    except targets.TargetException as exc:
+        logger.critical(exc)
+        sys.exit(1)
+
+    if not args['--workers'].isdigit() or int(args['--workers']) < 1:
         logger.critical(
-            'Some ip addresses not valid'
+            'Not valid number of workers - %s' % args['--workers']
         )
         sys.exit(1)
 
-    if args['get-conf']:
-        if not args['--output']:
-            dir_path = '/dev/stdout' if len(ip_addrs) == 1 else '.'
-            file_path = ''
+    if not args['--rate'].isdigit():
+        logger.critical(
+            'Not valid rate - %s' % args['--rate']
+        )
+        sys.exit(1)
+
+    try:
+        wave_sizes = [
+            int(size) for size in args['--waves'].split(',')
+        ] if args['--waves'] else []
+        if any(size < 1 for size in wave_sizes):
+            raise ValueError
+    except ValueError:
+        logger.critical('Not valid waves - %s' % args['--waves'])
+        sys.exit(1)
+
+    try:
+        halt_ratio = float(args['--halt-ratio'])
+        if not 0 <= halt_ratio <= 1:
+            raise ValueError
+    except ValueError:
+        logger.critical('Not valid halt ratio - %s' % args['--halt-ratio'])
+        sys.exit(1)
+
+    if args['--method'] not in ['telnet', 'tftp', 'snmp']:
+        logger.critical(
+            'Not valid method - %s' % args['--method']
+        )
+        sys.exit(1)
+
+    if args['--source'] not in ['config', 'snmp']:
+        logger.critical(
+            'Not valid source - %s' % args['--source']
+        )
+        sys.exit(1)
+
+    if args['--format'] not in ['text', 'ndjson']:
+        logger.critical(
+            'Not valid format - %s' % args['--format']
+        )
+        sys.exit(1)
+
+    if args['history']:
+        try:
+            cfg_history = history.History(args['<dir>'])
+            if args['--changes']:
+                for timestamp, ip, diff in cfg_history.changes(args['--changes']):
+                    sys.stdout.writelines(diff)
+            else:
+                timestamp = None
+                if args['<date>']:
+                    timestamp = time_parse(args['<date>'])
+                    if timestamp is None:
+                        logger.critical(
+                            'Not valid date - %s' % args['<date>']
+                        )
+                        sys.exit(1)
+                config = cfg_history.get(args['<ip>'][0], timestamp)
+                if config is None:
+                    logger.error(
+                        '%s - configuration not found in history' % args['<ip>'][0]
+                    )
+                    sys.exit(1)
+                sys.stdout.write(config)
+        except history.HistoryException as exc:
+            logger.critical(exc)
+            sys.exit(1)
+        sys.exit(0)
+
+    if args['query']:
+        # подключение к отсутствующему файлу создало бы пустую базу
+        if not os.path.exists(args['<db>']):
+            logger.critical('No such file: %r' % args['<db>'])
+            sys.exit(1)
+
+        try:
+            db = index.Index(args['<db>'])
+            columns, rows = db.query(args['<sql>'], args['<param>'])
+            db.close()
+        except index.IndexException as exc:
+            logger.critical(exc)
+            sys.exit(1)
+
+        for row in rows:
+            if args['--format'] == 'ndjson':
+                output.write(json.dumps(dict(zip(columns, row))) + '\n')
+            else:
+                output.write('\t'.join(unicode(v) for v in row).encode('utf-8') + '\n')
+        sys.exit(0)
+
+    if args['index']:
+        try:
+            db = index.Index(args['<db>'])
+            indexed = db.hashes()
+        except index.IndexException as exc:
+            logger.critical(exc)
+            sys.exit(1)
+
+        paths = []
+        for path in args['<config>']:
+            if os.path.isdir(path):
+                paths.extend(sorted(
+                    os.path.join(path, name) for name in os.listdir(path)
+                    if name.endswith('.cfg')
+                ))
+            else:
+                paths.append(path)
+
+        items = [(path, indexed.get(config_ip(path))) for path in paths]
+
+        counts = collections.Counter()
+        current = set()
+        try:
+            for record in pool.process_imap_unordered(
+                    index_job, items, int(args['--workers']),
+                    audit_init, (args, None)):
+                if record['status'] == 'ok':
+                    db.update(
+                        record['ip'], record['eqp_type'],
+                        record['config_hash'], record['ports'],
+                        record['options']
+                    )
+                if record['status'] in ['ok', 'skipped']:
+                    current.add(record['ip'])
+                counts[record['status']] += 1
+
+            # записи оборудования, файлы которого исчезли или не
+            # разбираются, устарели и не должны попадать в запросы
+            counts['removed'] = db.prune(current)
+        except index.IndexException as exc:
+            logger.critical(exc)
+            sys.exit(1)
+        finally:
+            db.close()
+
+        logger.info(
+            '%s equipment indexed, %s unchanged, %s failed, %s removed' % (
+                counts['ok'], counts['skipped'], counts['error'],
+                counts['removed']
+            )
+        )
+        sys.exit(1 if counts['error'] else 0)
+
+    if args['plan'] or args['audit']:
+        config = None
+        if not args['--profile']:
+            try:
+                config = json_config.Config(settings.settings_dir_path)
+            except json_config.ConfigException as exc:
+                logger.critical(exc)
+                sys.exit(1)
+
+        paths = []
+        for path in args['<config>']:
+            if args['audit'] and os.path.isdir(path):
+                paths.extend(sorted(
+                    os.path.join(path, name) for name in os.listdir(path)
+                    if name.endswith('.cfg')
+                ))
+            else:
+                paths.append(path)
+
+        if args['audit']:
+            records = pool.process_imap_unordered(
+                audit_job, paths, int(args['--workers']),
+                audit_init, (args, config)
+            )
         else:
-            dir_path, file_path = os.path.split(args['--output'])
+            cache = {}
+            records = (plan(path, args, config, cache) for path in paths)
+
+        failed = 0
+        compliant = 0
+        for record in records:
+            emit(record, args['--format'], output)
+            if record['status'] != 'ok':
+                failed += 1
+            elif not record['commands']:
+                compliant += 1
+                if args['plan']:
+                    logger.info('%s - tune not required' % record['ip'])
+            elif args['--format'] == 'text':
+                if args['plan']:
+                    print record['commands']
+                else:
+                    print '%-15s  %-12s  %s commands' % (
+                        record['ip'], record['eqp_type'],
+                        len(record['commands'])
+                    )
+
+        if args['audit']:
+            logger.info(
+                '%s equipment audited: %s compliant, %s require tuning, '
+                '%s failed' % (
+                    len(paths), compliant,
+                    len(paths) - compliant - failed, failed
+                )
+            )
+
+        sys.exit(1 if failed else 0)
+
+    if args['discover']:
+        limiter = pool.RateLimiter(int(args['--rate']))
+
+        def discover(ip):
+            limiter.wait()
+            return ip, dlink.discover(ip, settings.community_read)
+
+        try:
+            _f = open(args['--output'] or '/dev/stdout', 'w')
+        except IOError as exc:
+            logger.critical(exc)
+            sys.exit(1)
+
+        with _f:
+            for ip, result in pool.imap_unordered(
+                    discover, ip_addrs, int(args['--workers'])):
+                if result:
+                    _f.write('%-15s  # %s %s\n' % ((ip, ) + result))
+                    _f.flush()
+        sys.exit(0)
+
+    plans = None
+    if args['apply']:
+        try:
+            plans = load_plan(args['<plan>'])
+        except (IOError, ValueError, KeyError, AttributeError) as exc:
+            logger.critical('Not valid plan file - %s' % exc)
+            sys.exit(1)
+        ip_addrs = plans.keys()
+
+    # ограничения передач файлов через TFTP сервер общие для всего
+    # оборудования, остальные этапы выполняются всеми потоками параллельно
+    if 'scheduler' not in shared:
+        shared['scheduler'] = make_scheduler()
+
+    # задержки оборудования, по которым вычисляются таймауты, без
+    # файла задержек используются таймауты по умолчанию
+    limits = dict(timings.limits)
+    limits.update(getattr(settings, 'timeout_limits', {}))
+
+    eqp_timings = shared.setdefault('timings', {}).get(args['--timings'])
+    if not eqp_timings:
+        try:
+            eqp_timings = timings.Timings(
+                args['--timings'],
+                getattr(settings, 'timeout_factor', 3),
+                limits=limits
+            )
+        except timings.TimingsException as exc:
+            logger.critical(exc)
+            sys.exit(1)
+        shared['timings'][args['--timings']] = eqp_timings
+
+    env = {
+        'single': not args['--input-file'] and len(ip_addrs) == 1,
+        'scheduler': shared['scheduler'],
+        'timings': eqp_timings,
+        'archive': None,
+        'history': None,
+        'dir_path': None,
+        'file_path': '',
+        'skip_unchanged': False,
+        'config': None,
+        'plan': plans,
+        # команды настройки оборудования с одинаковыми типом, состоянием
+        # опций и настройками, вычисляются один раз за запуск
+        'plan_cache': {}
+    }
+
+    if args['get-conf']:
+        job = get_conf
+
+        if args['--history']:
+            try:
+                env['history'] = history.History(args['--history'])
+            except history.HistoryException as exc:
+                logger.critical(exc)
+                sys.exit(1)
+
+        if args['--archive']:
+            try:
+                env['archive'] = archive.Archive(args['--archive'])
+            except archive.ArchiveException as exc:
+                logger.critical(exc)
+                sys.exit(1)
+
+        elif args['--output']:
+            dir_path, env['file_path'] = os.path.split(args['--output'])
             if not dir_path:
                 dir_path = '.'
-            if len(ip_addrs) != 1:
+            if not env['single']:
                 dir_path = args['--output']
+            env['dir_path'] = dir_path
+
+        # в режиме ndjson конфигурационный файл передается в записи
+        # результата, поэтому по умолчанию файлы не записываются
+        elif args['--format'] == 'text':
+            env['dir_path'] = '/dev/stdout' if env['single'] else '.'
+
+        if env['dir_path']:
+            if not os.access(env['dir_path'], os.F_OK):
+                logger.critical(
+                    'No such directory: %r' % env['dir_path']
+                )
+                sys.exit(1)
 
-        if not os.access(dir_path, os.F_OK):
+            if not os.access(env['dir_path'], os.W_OK):
+                logger.critical(
+                    'Permission denied: %r' % env['dir_path']
+                )
+                sys.exit(1)
+
+        # без признаков изменения отпечаток не получается и файлы
+        # получаются всегда, что незаметно для включившего опцию
+        if args['--skip-unchanged'] and \
+                not getattr(settings, 'fingerprint_oids', None):
             logger.critical(
-                'No such directory: %r' % dir_path
+                '--skip-unchanged requires fingerprint_oids in settings.py'
             )
             sys.exit(1)
 
-        if not os.access(dir_path, os.W_OK):
-            logger.critical(
-                'Permission denied: %r' % dir_path
+        # отпечатки сохраняются только рядом с обычными файлами или в архиве
+        env['skip_unchanged'] = args['--skip-unchanged'] and (
+            bool(env['archive']) or
+            env['dir_path'] not in [None, '/dev/stdout']
+        )
+
+    elif args['apply']:
+        job = apply_plan
+
+    else:
+        job = tune
+
+        # файлы настройки читаются один раз за запуск и
+        # разделяются между всем оборудованием
+        if not args['<file>']:
+            try:
+                env['config'] = json_config.Config(settings.settings_dir_path)
+            except json_config.ConfigException as exc:
+                logger.critical(exc)
+                sys.exit(1)
+
+    # при продолжении прерванного запуска оборудование, уже обработанное
+    # той же командой, пропускается
+    cmd_journal = None
+    if args['--resume']:
+        # пробный запуск tune журналируется отдельно, иначе последующий
+        # настоящий запуск пропустил бы ненастроенное оборудование
+        command = 'get-conf' if args['get-conf'] else \
+            'apply' if args['apply'] else \
+            'tune-n' if args['--dry-run'] else 'tune'
+        done = journal.load_done(args['--resume'], command)
+        if done:
+            logger.info(
+                '%s equipment already processed, skipped' % len(done)
             )
+            ip_addrs = (ip for ip in ip_addrs if ip not in done)
+
+        try:
+            cmd_journal = journal.Journal(args['--resume'], command)
+        except journal.JournalException as exc:
+            logger.critical(exc)
             sys.exit(1)
 
-        for equipment in eqp_gen(ip_addrs):
+    failed = False
+
+    registry = None
+    if args['--metrics']:
+        registry = metrics.Registry()
+        metrics.enable(registry)
+
+    # изменения вносятся волнами, после каждой волны проверяется доля
+    # оборудования с ошибками, недоступное оборудование и оборудование
+    # с изменившейся конфигурацией ошибкой настройки не считаются
+    if wave_sizes and not args['get-conf'] and not args['--dry-run']:
+        ip_waves = pool.waves(ip_addrs, wave_sizes)
+    else:
+        wave_sizes = []
+        ip_waves = [ip_addrs]
+
+    try:
+        for number, wave in enumerate(ip_waves, 1):
+            start = time.time()
+            counts = collections.Counter()
+            # статусы оборудования, на которое отправлялись команды
+            pushed = collections.Counter()
+
+            for record in pool.imap_unordered(
+                    lambda ip: run_job(job, ip, args, env), wave,
+                    int(args['--workers'])):
+                emit(record, args['--format'], output)
+                env['timings'].add(record['ip'], record['latency'])
+                if cmd_journal:
+                    cmd_journal.write(record)
+                if record['status'] not in ['ok', 'skipped']:
+                    failed = True
+                counts[record['status']] += 1
+                if 'apply' in record['timings']:
+                    pushed[record['status']] += 1
+
+            if not wave_sizes:
+                continue
+
+            elapsed = time.time() - start
+            total = sum(counts.values())
+            applied = sum(pushed.values())
+            logger.info(
+                'wave %s: %s equipment in %.1f s (%.2f per second), '
+                'commands sent to %s, %s failed on apply, %s failed before '
+                'apply, %s unreachable, %s changed' % (
+                    number, total, elapsed, total / max(elapsed, 0.001),
+                    applied, pushed['error'],
+                    counts['error'] - pushed['error'],
+                    counts['unreachable'], counts['changed']
+                )
+            )
+
+            # доля ошибок считается только среди оборудования, на которое
+            # отправлялись команды, оборудование без изменений и ошибки
+            # до отправки команд на нее не влияют
+            if applied and float(pushed['error']) / applied > halt_ratio:
+                logger.critical(
+                    'wave %s: %.0f%% of equipment failed on apply, '
+                    'rollout halted' % (
+                        number, 100.0 * pushed['error'] / applied
+                    )
+                )
+                break
+    finally:
+        # каждый ресурс освобождается независимо от ошибок остальных
+        try:
+            env['timings'].save()
+        except timings.TimingsException as exc:
+            logger.error(exc)
+
+        if cmd_journal:
+            try:
+                cmd_journal.close()
+            except journal.JournalException as exc:
+                logger.error(exc)
+
+        metrics.disable()
+        if registry:
             try:
-                config = equipment.get_config()
-            except dlink.DlinkConfigException as exc:
+                registry.write(args['--metrics'])
+            except metrics.MetricsException as exc:
                 logger.error(exc)
+
+        # в режиме сервиса задание может прерваться исключением или
+        # отключением клиента, манифест архива закрывается в любом случае
+        if env['archive']:
+            env['archive'].close()
+
+    # get-conf, как и раньше, завершается с кодом 0 при ошибках на части
+    # оборудования, результаты по каждому оборудованию есть в выводе ndjson
+    sys.exit(1 if failed and not args['get-conf'] else 0)
+
+def serve(path):
+    """
+    Работа в режиме сервиса: модули, настройки, файлы настройки
+    оборудования, snmp генераторы и ssh соединения остаются загруженными
+    между заданиями, задания принимаются через unix сокет
+    """
+
+    # SocketServer нужен только в режиме сервиса
+    import SocketServer
+
+    class JobServer(SocketServer.ThreadingMixIn,
+                    SocketServer.UnixStreamServer):
+        """
+        Сервер заданий, каждое соединение обрабатывается в отдельном потоке
+        """
+
+        daemon_threads = True
+
+    class JobHandler(SocketServer.StreamRequestHandler):
+        """
+        Обработка задания: клиент передает строку json с массивом аргументов
+        командной строки get-conf, tune или apply, в ответ по мере обработки
+        оборудования передаются записи результатов в формате ndjson и
+        последней строкой - {"exit": <код завершения>}
+        """
+
+        def handle(self):
+            result = {'exit': 1}
+
+            try:
+                argv = [
+                    arg.encode('utf-8')
+                    for arg in json.loads(self.rfile.readline())
+                ]
+                args = docopt(__doc__, argv, help=False)
+            except (ValueError, TypeError, AttributeError, SystemExit) as exc:
+                result['error'] = 'not valid job - %s' % exc
             else:
-                if len(ip_addrs) == 1:
-                    path = dir_path if not args['--output'] else os.path.join(dir_path, file_path)
+                if not args['get-conf'] and not args['tune'] and \
+                        not args['apply']:
+                    result['error'] = \
+                        'only get-conf, tune and apply jobs are allowed'
+                elif args['--metrics']:
+                    result['error'] = \
+                        '--metrics is not available in service mode'
                 else:
-                    path = os.path.join(dir_path, equipment.ip + '.cfg')
-                with open(path, 'w') as _f:
-                    _f.write(config)
+                    args['--format'] = 'ndjson'
+                    try:
+                        main(args, self.wfile, self.server.shared)
+                    except SystemExit as exc:
+                        result['exit'] = exc.code or 0
+                    except Exception as exc:
+                        logger.critical('job failed - %r' % exc)
+                        result['error'] = 'job failed - %s' % exc
 
-    elif args['tune']:
-        for equipment in eqp_gen(ip_addrs):
             try:
-                if args['<file>']:
-                    func, arg = json_config.Config.get_options, args['<file>']
-                else:
-                    config = json_config.Config(settings.settings_dir_path)
-                    func, arg = config.load_options, equipment.get_eqp_type()
-                cmd = equipment.analyze_config(func(arg))
-                if not cmd:
-                    logger.info('%s - tune not required' % equipment.ip)
-                    sys.exit(0)
-            except (json_config.ConfigException,
-                    dlink.DlinkInitException,
-                    dlink.DlinkConfigException) as exc:
-                logger.critical(exc)
-                sys.exit(1)
+                self.wfile.write(json.dumps(result) + '\n')
+            except socket.error as exc:
+                logger.warning('client disconnected - %s' % exc)
 
-            if args['--dry-run']:
-                print cmd
-            else:
-                conn = telnet.Telnet(equipment.ip, eqp_type=equipment.eqp_type)
-                try:
-                    conn.login(
-                        settings.telnet_username,
-                        settings.telnet_password
-                    )
-                except (telnet.TelnetConnException,
-                        telnet.TelnetLoginException) as exc:
-                    logger.critical(exc)
-                    sys.exit(1)
+    if os.path.exists(path):
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            logger.critical('Not a socket: %r' % path)
+            sys.exit(1)
+        os.remove(path)
 
-                try:
-                    conn.exec_cmd(*cmd)
-                    conn.save_config()
-                except telnet.TelnetConnException as exc:
-                    logger.critical(exc)
-                    sys.exit(1)
-                conn.close()
+    server = JobServer(path, JobHandler)
+    server.shared = {'scheduler': make_scheduler()}
+    logger.info('waiting for jobs on %s' % path)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(path)
+
+if __name__ == '__main__':
+    args = docopt(__doc__)
+
+    logger.setLevel(settings.log_level)
+    formatter = ColoredFormatter(
+        fmt='%(asctime)s   %(levelname)-8s   %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    # в режиме ndjson и при выводе результатов обнаружения в stdout
+    # stdout используется только для результатов
+    if args['--format'] == 'ndjson' or \
+            (args['discover'] and not args['--output']):
+        log_stream = sys.stderr
+    else:
+        log_stream = sys.stdout
+    stdout_log = logging.StreamHandler(log_stream)
+    stdout_log.setFormatter(formatter)
+    logger.addHandler(stdout_log)
+
+    if args['serve']:
+        serve(args['<socket>'])
+    else:
+        main(args)
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+Startup time benchmark of run.py, each scenario is run in a new interpreter,
+benchmark fails if scenario loads modules it doesn't need or its median
+startup time exceeds the limit
+
+usage:
+    startup_bench.py [-n <count>] [-l <ms>]
+
+options:
+    -h --help                 show this screen
+    -n --count <count>        number of runs of each scenario [default: 10]
+    -l --limit <ms>           maximum median startup time in milliseconds,
+                              0 - don't check [default: 300]
+"""
+
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from docopt import docopt
+
+
+# модули, загрузка которых при запуске считается регрессией
+heavy_modules = ['paramiko', 'pysnmp', 'pyparsing', 'dictdiffer', 'telnetlib']
+# модули стандартной библиотеки, нужные только части команд: сервису,
+# индексу, пулу процессов, архиву и истории конфигурационных файлов
+command_modules = [
+    'SocketServer', 'sqlite3', '_sqlite3', 'multiprocessing', 'gzip', 'zlib',
+    'difflib'
+]
+
+# код, выполняемый в отдельном интерпретаторе: запуск run.py с указанными
+# аргументами или импорт модуля и вывод времени и загруженных модулей
+driver = r'''
+import json, os, sys
+sys.path.insert(0, os.getcwd())
+argv = [str(arg) for arg in json.loads(sys.argv[1])]
+try:
+    if argv[0] == 'import':
+        __import__(argv[1])
+    else:
+        sys.argv = ['run.py'] + argv
+        execfile('run.py', {'__name__': '__main__', '__file__': 'run.py'})
+except SystemExit:
+    pass
+sys.stderr.write('\n' + json.dumps(
+    sorted(set(name.split('.')[0] for name in sys.modules))
+) + '\n')
+'''
+
+
+def run(argv):
+    """
+    Запуск сценария в отдельном интерпретаторе.
+
+    :param argv: массив аргументов run.py или ['import', <модуль>]
+    :rtype: кортеж из времени запуска в секундах (включая запуск
+            интерпретатора) и множества загруженных модулей верхнего уровня
+    """
+
+    start = time.time()
+    proc = subprocess.Popen(
+        [sys.executable, '-c', driver, json.dumps(argv)],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    stdout, stderr = proc.communicate()
+    elapsed = time.time() - start
+
+    try:
+        return elapsed, set(json.loads(stderr.strip().splitlines()[-1]))
+    except (IndexError, ValueError):
+        raise BenchException(
+            'scenario %s failed:\n%s' % (' '.join(argv), stderr)
+        )
+
+
+def main(args):
+    count = int(args['--count'])
+    limit = int(args['--limit'])
+
+    history_dir = tempfile.mkdtemp()
+    # get-conf завершается на проверке папки назначения, до обращения
+    # к оборудованию, поэтому измеряется только запуск команды
+    output = os.path.join(history_dir, 'missing', '10.0.0.1.cfg')
+    scenarios = [
+        ('help', ['--help'], heavy_modules + command_modules),
+        ('get-conf', ['get-conf', '10.0.0.1', '-o', output],
+         heavy_modules + command_modules),
+        ('history', ['history', history_dir, '10.0.0.1'],
+         heavy_modules + [name for name in command_modules
+                          if name not in ['difflib', 'zlib']]),
+        ('import lib.dlink', ['import', 'lib.dlink'], heavy_modules),
+        ('import lib.ping', ['import', 'lib.ping'], heavy_modules),
+    ]
+
+    failed = False
+
+    try:
+        for name, argv, forbidden in scenarios:
+            times = []
+            for _c in xrange(count):
+                elapsed, modules = run(argv)
+                times.append(elapsed)
+
+            median = sorted(times)[len(times) // 2] * 1000
+            loaded = sorted(modules.intersection(forbidden))
+
+            status = 'ok'
+            if loaded or (limit and median > limit):
+                status = 'FAIL'
+                failed = True
+
+            print '%-20s %8.1f ms   %-4s %s' % (
+                name, median, status,
+                'loaded: ' + ', '.join(loaded) if loaded else ''
+            )
+    finally:
+        shutil.rmtree(history_dir)
+
+    return 1 if failed else 0
+
+
+class BenchException(Exception):
+    pass
+
+
+if __name__ == '__main__':
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        sys.exit(main(docopt(__doc__)))
+    except BenchException as exc:
+        sys.stderr.write('%s\n' % exc)
+        sys.exit(1)